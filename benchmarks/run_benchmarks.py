@@ -0,0 +1,202 @@
+"""
+Time every pipeline stage on synthetic data of several sizes and write the results as JSON.
+
+    python benchmarks/run_benchmarks.py --sizes xs s --output benchmark.json
+
+Runs offline; the GMT variants of the stages are skipped when GMT is not installed.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from synthetic import make_dataset
+from preprocess import preprocess_folder
+from track_index import TrackIndex, INDEX_FILE_NAME, read_coordinates
+from crossover import analyze_folders, list_sub_folders
+from folder_stats import load_folder_data
+from corrections import correct_travel_time, remove_outliers, correct_scale_factor
+
+# Dataset sizes: (tracks, points per track)
+SIZES = {
+    'xs': (10, 100),
+    's': (100, 1000),
+    'm': (1000, 1000),
+    'l': (1000, 10000),
+    'xl': (10000, 1000),
+}
+
+
+def gmt_version():
+    """Installed GMT version, or None"""
+    if shutil.which('gmt') is None:
+        return None
+    result = subprocess.run(['gmt', '--version'], capture_output=True, text=True)
+    return result.stdout.strip() or 'unknown'
+
+
+class Benchmark:
+    """Collects one timing record per stage and size"""
+
+    def __init__(self):
+        self.results = []
+
+    def run(self, size, stage, function, **info):
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        value = function()
+        record = {
+            'size': size,
+            'stage': stage,
+            'wall_seconds': time.perf_counter() - start_wall,
+            # CPU time of this process only; work done in pool workers shows up in the wall time
+            'cpu_seconds': time.process_time() - start_cpu,
+        }
+        record.update(info)
+        self.results.append(record)
+        print(f"{size:>3} {stage:<32} {record['wall_seconds']:9.3f} s", file=sys.stderr)
+        return value
+
+    def skip(self, size, stage, reason):
+        self.results.append({'size': size, 'stage': stage, 'skipped': reason})
+        print(f"{size:>3} {stage:<32} skipped: {reason}", file=sys.stderr)
+
+
+def overlap_search(main_folder, sids, a_sids):
+    """Build the track index of the folder and query it for every folder A track"""
+    track_index = TrackIndex.build(main_folder, sids)
+    overlapping = 0
+    for sid in a_sids:
+        coordinates = read_coordinates(os.path.join(main_folder, sid, 'lon_lat.txt'))
+        overlapping += sum(1 for other in track_index.query_track(coordinates) if other != sid)
+    return overlapping
+
+
+def run_size(benchmark, size, tracks, points_per_track, workdir, workers, cross_tracks, seed):
+    folder = os.path.join(workdir, size)
+    dataset = make_dataset(folder, tracks, points_per_track, seed=seed)
+    info = {'tracks': tracks, 'points': dataset['points']}
+    has_gmt = shutil.which('gmt') is not None
+
+    # Preprocessing: native reader and sampler, then the GMT tools when they are installed
+    processed = os.path.join(folder, 'processed')
+    benchmark.run(size, 'preprocess', lambda: preprocess_folder(
+        dataset['m77t_folder'], processed, dataset['grid'], workers=workers, force=True,
+        reader='native', sampler='native'), **info)
+    if has_gmt:
+        gmt_processed = os.path.join(folder, 'processed_gmt')
+        benchmark.run(size, 'preprocess_gmt', lambda: preprocess_folder(
+            dataset['m77t_folder'], gmt_processed, dataset['grid'], workers=workers, force=True,
+            reader='gmt', sampler='gmt'), **info)
+    else:
+        benchmark.skip(size, 'preprocess_gmt', 'GMT not installed')
+
+    # Folder A holds copies of the first tracks; folder B is every processed track
+    sids = sorted(list_sub_folders(processed))
+    a_sids = sids[:cross_tracks]
+    folder_a = os.path.join(folder, 'cross_a')
+    for sid in a_sids:
+        shutil.copytree(os.path.join(processed, sid), os.path.join(folder_a, sid), dirs_exist_ok=True)
+    cross_info = dict(info, a_tracks=len(a_sids))
+
+    index_path = os.path.join(processed, INDEX_FILE_NAME)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    overlapping = benchmark.run(size, 'overlap_search', lambda: overlap_search(processed, sids, a_sids),
+                                **cross_info)
+    benchmark.run(size, 'overlap_search_cached', lambda: overlap_search(processed, sids, a_sids),
+                  overlapping_pairs=overlapping, **cross_info)
+
+    # The first run computes every pair; the unchanged rerun measures the manifest check alone
+    benchmark.run(size, 'crossover_native', lambda: analyze_folders(
+        folder_a, processed, workers=workers, engine='native', incremental=True), **cross_info)
+    benchmark.run(size, 'crossover_native_rerun', lambda: analyze_folders(
+        folder_a, processed, workers=workers, engine='native', incremental=True), **cross_info)
+    if has_gmt:
+        benchmark.run(size, 'crossover_gmt', lambda: analyze_folders(
+            folder_a, processed, workers=workers, engine='gmt', incremental=False), **cross_info)
+    else:
+        benchmark.skip(size, 'crossover_gmt', 'GMT not installed')
+    crossovers = 0
+    for sid in a_sids:
+        with open(os.path.join(folder_a, sid, 'crossover.txt')) as crossover_file:
+            crossovers += sum(1 for _ in crossover_file)
+
+    benchmark.run(size, 'statistics_load', lambda: [load_folder_data(processed, sid) for sid in sids], **info)
+
+    # Outliers need crossover.txt, so only the folder A tracks go through that correction
+    def corrections(function, main_folder, sub_folders):
+        return lambda: [function(os.path.join(main_folder, sid)) for sid in sub_folders]
+
+    summaries = benchmark.run(size, 'correct_travel_time', corrections(correct_travel_time, processed, sids), **info)
+    benchmark.results[-1]['points_corrected'] = sum(sum(s['corrected'].values()) for s in summaries)
+    summaries = benchmark.run(size, 'correct_outliers', corrections(remove_outliers, folder_a, a_sids), **cross_info)
+    benchmark.results[-1]['outliers_found'] = sum(s['outliers'] for s in summaries)
+    benchmark.run(size, 'correct_scale_factor', corrections(correct_scale_factor, processed, sids), **info)
+
+    injected = dataset['errors']
+    return {
+        'size': size,
+        'tracks': tracks,
+        'points': dataset['points'],
+        'a_tracks': len(a_sids),
+        'overlapping_pairs': overlapping,
+        'crossovers': crossovers,
+        'injected_scale_factor_tracks': sum(1 for e in injected.values() if e['scale_factor']),
+        'injected_travel_time_points': sum(e['travel_time_points'] for e in injected.values()),
+        'injected_outlier_points': sum(e['outlier_points'] for e in injected.values()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark every pipeline stage on synthetic data')
+    parser.add_argument('--sizes', nargs='+', choices=sorted(SIZES), default=['xs', 's'])
+    parser.add_argument('--output', default='benchmark.json', help='JSON results file')
+    parser.add_argument('--workdir', help='folder for the generated data, kept after the run '
+                                          '(default: a temporary folder that is removed)')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary folder')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--cross-tracks', type=int, default=10, help='folder A tracks of the crossover stage')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bathy_benchmark_')
+    os.makedirs(workdir, exist_ok=True)
+    benchmark = Benchmark()
+    datasets = []
+    try:
+        for size in args.sizes:
+            tracks, points_per_track = SIZES[size]
+            datasets.append(run_size(benchmark, size, tracks, points_per_track, workdir, args.workers,
+                                     min(args.cross_tracks, tracks), args.seed))
+    finally:
+        if not args.workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'workers': args.workers,
+            'gmt': gmt_version(),
+        },
+        'datasets': datasets,
+        'results': benchmark.results,
+    }
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f'Results written to {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
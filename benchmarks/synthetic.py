@@ -0,0 +1,142 @@
+"""
+Synthetic cruises and bathymetric model for the benchmarks.
+
+The model is a smooth analytic surface written as a netCDF grid. Cruises are straight-ish tracks across
+the model region that sample the same surface, plus noise and optionally injected errors:
+a scale factor on whole cruises, 750 m travel-time jumps on runs of records, and isolated outliers.
+"""
+import os
+import numpy as np
+
+# Columns of an MGD77T file, in order
+MGD77T_COLUMNS = (
+    'SURVEY_ID', 'TIMEZONE', 'DATE', 'TIME', 'LAT', 'LON', 'POS_TYPE', 'NAV_QUALCO', 'BAT_TTIME', 'CORR_DEPTH',
+    'BAT_CPCO', 'BAT_TYP', 'BAT_QUALCO', 'MAG_TOT', 'MAG_TOT2', 'MAG_RES', 'MAG_RESSEN', 'MAG_DICORR',
+    'MAG_SDEPTH', 'DIUR_COR', 'MAG_QUALCO', 'GRA_OBS', 'EOT', 'FREE_AIR', 'GRA_QUALCO', 'LINEID', 'POINTID',
+)
+
+# Records written per block when a cruise file is generated
+WRITE_BLOCK = 200000
+
+
+def model_depth(lon, lat):
+    """Elevation of the synthetic model (negative below sea level) at the given points"""
+    lon = np.radians(lon)
+    lat = np.radians(lat)
+    return (-4000 + 1500 * np.sin(3 * lon) * np.cos(2 * lat) + 600 * np.cos(7 * lon + 5 * lat)
+            + 300 * np.sin(19 * lon) * np.sin(23 * lat))
+
+
+def write_grid(path, region, spacing):
+    """Write the synthetic model over region (west, east, south, north) at `spacing` degrees as a netCDF grid"""
+    from scipy.io import netcdf_file
+
+    west, east, south, north = region
+    x = np.arange(west, east + spacing / 2, spacing)
+    y = np.arange(south, north + spacing / 2, spacing)
+    with netcdf_file(path, 'w') as grid:
+        grid.createDimension('x', len(x))
+        grid.createDimension('y', len(y))
+        grid.createVariable('x', 'd', ('x',))[:] = x
+        grid.createVariable('y', 'd', ('y',))[:] = y
+        z = grid.createVariable('z', 'f', ('y', 'x'))
+        for r0 in range(0, len(y), 1024):
+            rows = y[r0:r0 + 1024]
+            z[r0:r0 + len(rows)] = model_depth(x[np.newaxis, :], rows[:, np.newaxis]).astype(np.float32)
+    return path
+
+
+def track_positions(rng, points, region):
+    """A gently curving track from one edge of the region to the opposite one"""
+    west, east, south, north = region
+    t = np.linspace(0, 1, points)
+    if rng.random() < 0.5:
+        lon = west + (east - west) * t
+        lat = rng.uniform(south, north) + (north - south) * 0.1 * np.sin(2 * np.pi * (t + rng.random()))
+    else:
+        lat = south + (north - south) * t
+        lon = rng.uniform(west, east) + (east - west) * 0.1 * np.sin(2 * np.pi * (t + rng.random()))
+    return np.clip(lon, west, east), np.clip(lat, south, north)
+
+
+def inject_errors(rng, depth, scale_factor=0.0, travel_time_runs=0, outliers=0):
+    """
+    Add errors to a cruise's depths (positive down) in place and return what was injected:
+    the cruise depth scaled by `scale_factor`, `travel_time_runs` runs of records shifted by +-750 m,
+    and `outliers` isolated records moved by 2000-4000 m.
+    """
+    injected = {'scale_factor': float(scale_factor), 'travel_time_points': 0, 'outlier_points': 0}
+    if scale_factor:
+        depth *= 1 + scale_factor
+    n = len(depth)
+    for _ in range(travel_time_runs):
+        start = rng.integers(0, n)
+        stop = min(n, start + rng.integers(1, max(2, n // 20)))
+        depth[start:stop] += 750 * rng.choice((-1, 1))
+        injected['travel_time_points'] += int(stop - start)
+    if outliers:
+        index = rng.choice(n, size=min(outliers, n), replace=False)
+        depth[index] += rng.uniform(2000, 4000, len(index)) * rng.choice((-1, 1), len(index))
+        injected['outlier_points'] += len(index)
+    return injected
+
+
+def write_mgd77t(path, survey_id, lon, lat, depth, start_time=0.0, interval=60.0):
+    """Write a cruise as a tab-delimited MGD77T file with the standard header; only navigation and depth are set"""
+    seconds = start_time + interval * np.arange(len(lon))
+    days = (seconds // 86400).astype('datetime64[D]')
+    date = np.char.replace(np.datetime_as_string(days), '-', '')
+    minutes = (seconds % 86400) / 60
+    time = (minutes // 60) * 100 + minutes % 60
+    travel_time = depth / 750.0
+    empty = '\t' * (len(MGD77T_COLUMNS) - 10)
+
+    with open(path, 'w') as m77_file:
+        m77_file.write('\t'.join(MGD77T_COLUMNS) + '\n')
+        for b0 in range(0, len(lon), WRITE_BLOCK):
+            block = slice(b0, b0 + WRITE_BLOCK)
+            m77_file.write(''.join(
+                f'{survey_id}\t0\t{d}\t{t:.3f}\t{y:.5f}\t{x:.5f}\t1\t\t{tt:.5f}\t{z:.1f}{empty}\n'
+                for d, t, y, x, tt, z in zip(date[block].tolist(), time[block].tolist(), lat[block].tolist(),
+                                             lon[block].tolist(), travel_time[block].tolist(),
+                                             depth[block].tolist())))
+    return path
+
+
+def make_dataset(folder, tracks, points_per_track, region=(0.0, 20.0, -10.0, 10.0), grid_spacing=1 / 30,
+                 seed=0, noise=20.0, error_fraction=0.2):
+    """
+    Write `tracks` synthetic .m77t cruises into folder/m77t and the model into folder/model.nc.
+    About `error_fraction` of the cruises get each kind of injected error.
+    Returns a description of the dataset, including the errors injected per SID.
+    """
+    rng = np.random.default_rng(seed)
+    m77_folder = os.path.join(folder, 'm77t')
+    os.makedirs(m77_folder, exist_ok=True)
+    grid_path = write_grid(os.path.join(folder, 'model.nc'), region, grid_spacing)
+
+    errors = {}
+    for k in range(tracks):
+        sid = f'SYN{k:05d}'
+        lon, lat = track_positions(rng, points_per_track, region)
+        depth = -model_depth(lon, lat) + rng.normal(0, noise, points_per_track)
+        injected = inject_errors(
+            rng, depth,
+            scale_factor=rng.uniform(-0.08, 0.08) if rng.random() < error_fraction else 0.0,
+            travel_time_runs=int(rng.integers(1, 4)) if rng.random() < error_fraction else 0,
+            outliers=int(rng.integers(1, 10)) if rng.random() < error_fraction else 0)
+        write_mgd77t(os.path.join(m77_folder, f'{sid}.m77t'), sid, lon, lat, depth,
+                     start_time=k * 86400.0 * 30)
+        errors[sid] = injected
+
+    return {
+        'folder': folder,
+        'm77t_folder': m77_folder,
+        'grid': grid_path,
+        'tracks': tracks,
+        'points_per_track': points_per_track,
+        'points': tracks * points_per_track,
+        'region': list(region),
+        'grid_spacing': grid_spacing,
+        'errors': errors,
+    }
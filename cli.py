@@ -0,0 +1,309 @@
+"""
+Headless command-line entry points for batch nodes.
+
+    python cli.py preprocess INPUT OUTPUT GRID [--workers N] [--force]
+    python cli.py crossover FOLDER_A FOLDER_B [--workers N] [--engine auto|gmt|native|x2sys] [--full]
+    python cli.py stats FOLDER [--sid SID ...] [--maps CPT]
+    python cli.py crossovers FOLDER [--region MIN_LON MAX_LON MIN_LAT MAX_LAT] [--sid SID] [--threshold COE]
+    python cli.py correct {travel-time,outliers,scale-factor} FOLDER [--sid SID ...]
+    python cli.py correct pipeline FOLDER [--stages travel-time outliers scale-factor] [--workers N]
+
+Every result is written to standard output as one JSON object per line; progress messages of the
+stages go to standard error. Stage modules are imported only by the command that needs them,
+and no GUI or plotting module is ever imported.
+"""
+import os
+import sys
+import json
+import math
+import argparse
+import contextlib
+
+# Exit codes
+EXIT_OK = 0
+EXIT_FAILED = 1  # the command ran but at least one folder failed
+EXIT_USAGE = 2  # invalid arguments (argparse)
+EXIT_INPUT = 3  # an input folder or file does not exist
+EXIT_INTERRUPTED = 130
+
+
+class InputError(Exception):
+    pass
+
+
+def require_folder(path):
+    if not os.path.isdir(path):
+        raise InputError(f"Folder not found: {path}")
+
+
+def json_safe(value):
+    """A record with NaN and infinite floats replaced by None, since JSON has no such numbers"""
+    if isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(item) for item in value]
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def require_file(path):
+    if not os.path.isfile(path):
+        raise InputError(f"File not found: {path}")
+
+
+def select_sub_folders(main_folder, sids):
+    """SID folders of a main folder, restricted to the given SIDs when any are given"""
+    sub_folders = sorted(f for f in os.listdir(main_folder) if os.path.isdir(os.path.join(main_folder, f)))
+    if not sids:
+        return sub_folders
+    missing = [sid for sid in sids if sid not in sub_folders]
+    if missing:
+        raise InputError(f"SID folders not found in {main_folder}: {', '.join(missing)}")
+    return list(sids)
+
+
+def run_preprocess(args, emit):
+    from preprocess import preprocess_folder
+
+    require_folder(args.input)
+    require_file(args.grid)
+    os.makedirs(args.output, exist_ok=True)
+
+    def progress(done, total, sub_folder, processed):
+        emit({'event': 'sid', 'sid': sub_folder, 'done': done, 'total': total,
+              'status': 'processed' if processed else 'up_to_date'})
+
+    preprocess_folder(args.input, args.output, args.grid, workers=args.workers, progress=progress, force=args.force,
+                      reader=args.reader, sampler=args.sampler)
+    return EXIT_OK
+
+
+def run_crossover(args, emit):
+    from crossover import analyze_folders
+
+    require_folder(args.folder_a)
+    require_folder(args.folder_b)
+
+    def progress(done, total, sub_folder):
+        emit({'event': 'sid', 'sid': sub_folder, 'done': done, 'total': total, 'status': 'processed'})
+
+    analyze_folders(args.folder_a, args.folder_b, workers=args.workers, progress=progress, engine=args.engine,
+                    incremental=not args.full)
+    return EXIT_OK
+
+
+def run_stats(args, emit):
+    from folder_stats import list_statistics_folders, folder_statistics
+
+    require_folder(args.folder)
+    sub_folders = list_statistics_folders(args.folder)
+    if args.sid:
+        missing = [sid for sid in args.sid if sid not in sub_folders]
+        if missing:
+            raise InputError(f"SID folders without bathy.xyz and topo.xyz in {args.folder}: {', '.join(missing)}")
+        sub_folders = args.sid
+    if args.maps:
+        # Maps are rendered by GMT; nothing from matplotlib or Qt is needed
+        from map_render import render_map
+        require_file(args.maps)
+
+    failed = 0
+    for sub_folder in sub_folders:
+        try:
+            summary = folder_statistics(args.folder, sub_folder)
+            if summary is None:
+                emit({'event': 'sid', 'sid': sub_folder, 'status': 'no_data'})
+                continue
+            if args.maps and summary['crossover_file']:
+                summary['map'] = render_map(os.path.join(args.folder, sub_folder), sub_folder,
+                                            summary['crossover_file'], os.path.abspath(args.maps))
+            emit({'event': 'sid', 'sid': sub_folder, 'status': 'ok', **summary})
+        except (OSError, ValueError, RuntimeError) as e:
+            failed += 1
+            emit({'event': 'sid', 'sid': sub_folder, 'status': 'failed', 'error': str(e)})
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+def run_crossovers(args, emit):
+    from crossover_store import CrossoverStore, store_path
+
+    require_folder(args.folder)
+    require_file(store_path(args.folder))
+    with CrossoverStore(store_path(args.folder), read_only=True) as store:
+        records = store.query(args.region, args.sid, args.threshold)
+    for record in records.tolist():
+        emit({'event': 'crossover', **dict(zip(records.dtype.names, record))})
+    emit({'event': 'summary', 'crossovers': len(records)})
+    return EXIT_OK
+
+
+def run_correct(args, emit):
+    import corrections
+
+    require_folder(args.folder)
+    if args.store is not None:
+        require_file(args.store)
+    if args.method == 'pipeline':
+        return run_correction_pipeline(args, emit)
+    if args.method == 'travel-time':
+        def correct(path):
+            return corrections.correct_travel_time(path, args.steps, args.tolerance)
+    elif args.method == 'outliers':
+        def correct(path):
+            return corrections.remove_outliers(path, args.tolerance, args.threshold, args.misfit_threshold,
+                                               args.store)
+    else:
+        def correct(path):
+            return corrections.correct_scale_factor(path, args.chunk_size, args.bootstrap, args.workers or 1)
+
+    failed = 0
+    for sub_folder in select_sub_folders(args.folder, args.sid):
+        try:
+            summary = correct(os.path.join(args.folder, sub_folder))
+            emit({'event': 'sid', 'sid': sub_folder, 'status': 'ok', **summary})
+        except (OSError, ValueError) as e:
+            failed += 1
+            emit({'event': 'sid', 'sid': sub_folder, 'status': 'failed', 'error': str(e)})
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+def run_correction_pipeline(args, emit):
+    from correction_pipeline import correct_main_folder, list_correction_folders
+
+    sub_folders = None
+    if args.sid:
+        sub_folders = select_sub_folders(args.folder, args.sid)
+        missing = [sid for sid in sub_folders if sid not in list_correction_folders(args.folder)]
+        if missing:
+            raise InputError(f"SID folders without bathy.xyz and topo.xyz in {args.folder}: {', '.join(missing)}")
+
+    def progress(done, total, sub_folder, summary):
+        emit({'event': 'sid', 'sid': sub_folder, 'done': done, 'total': total, **summary})
+
+    summaries = correct_main_folder(
+        args.folder, args.stages, sub_folders, workers=args.workers, progress=progress, steps=args.steps,
+        step_tolerance=args.step_tolerance, crossover_tolerance=args.crossover_tolerance, threshold=args.threshold,
+        misfit_threshold=args.misfit_threshold, store=args.store, bootstrap=args.bootstrap)
+    failed = sum(1 for summary in summaries.values() if summary['status'] != 'ok')
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description='Headless single-beam bathymetry analysis')
+    parser.add_argument('--report', metavar='PATH', help='write a JSON run report with stage timers and counters')
+    parser.add_argument('--profile-stage', metavar='STAGE',
+                        help='profile one stage (e.g. crossover.cross_native) with cProfile into '
+                             'REPORT.STAGE.PID.prof')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    preprocess = commands.add_parser('preprocess', help='Extract bathy.xyz, lon_lat.txt and topo.xyz per SID')
+    preprocess.add_argument('input', help='folder of .m77t files')
+    preprocess.add_argument('output', help='folder receiving one folder per SID')
+    preprocess.add_argument('grid', help='bathymetric model (nc/grd)')
+    preprocess.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    preprocess.add_argument('--force', action='store_true', help='reprocess SIDs whose outputs are up to date')
+    preprocess.add_argument('--reader', choices=('native', 'gmt'), default='native')
+    preprocess.add_argument('--sampler', choices=('auto', 'native', 'gmt'), default='auto')
+    preprocess.set_defaults(run=run_preprocess)
+
+    crossover = commands.add_parser('crossover', help='Crossover errors of folder A tracks against folder B')
+    crossover.add_argument('folder_a')
+    crossover.add_argument('folder_b')
+    crossover.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    crossover.add_argument('--engine', choices=('auto', 'gmt', 'native', 'x2sys'), default='auto',
+                           help='x2sys: register folder B in a persistent x2sys TAG and batch the GMT calls')
+    crossover.add_argument('--full', action='store_true', help='recompute every pair instead of only changed ones')
+    crossover.set_defaults(run=run_crossover)
+
+    stats = commands.add_parser('stats', help='Ship/model and crossover statistics per SID')
+    stats.add_argument('folder')
+    stats.add_argument('--sid', nargs='+', help='only these SID folders')
+    stats.add_argument('--maps', metavar='CPT', help='also render the ECOE map of each SID with this CPT')
+    stats.set_defaults(run=run_stats)
+
+    crossovers = commands.add_parser('crossovers', help='Query the consolidated crossover store of folder A')
+    crossovers.add_argument('folder')
+    crossovers.add_argument('--region', type=float, nargs=4, metavar=('MIN_LON', 'MAX_LON', 'MIN_LAT', 'MAX_LAT'))
+    crossovers.add_argument('--sid', help='crossovers with this track on either side')
+    crossovers.add_argument('--threshold', type=float, help='only |COE| above this')
+    crossovers.set_defaults(run=run_crossovers)
+
+    correct = commands.add_parser('correct', help='Apply one correction, or the correction pipeline, to every SID')
+    correct.add_argument('method', choices=('travel-time', 'outliers', 'scale-factor', 'pipeline'))
+    correct.add_argument('folder')
+    correct.add_argument('--sid', nargs='+', help='only these SID folders')
+    correct.add_argument('--steps', type=float, nargs='+', default=(750,), help='travel-time steps (m)')
+    correct.add_argument('--tolerance', type=float, default=None,
+                         help='relative step tolerance (travel-time, default 0.05) or crossover box '
+                              'half-width in degrees (outliers, default 0.0167)')
+    correct.add_argument('--threshold', type=float, default=1000, help='|COE| marking outliers')
+    correct.add_argument('--store', help='crossover store (crossovers.sqlite) to read instead of crossover.txt')
+    correct.add_argument('--misfit-threshold', type=float, default=1000, help='ship/model difference of large errors')
+    correct.add_argument('--chunk-size', type=int, default=1000000, help='points per scale factor chunk')
+    correct.add_argument('--bootstrap', type=int, default=0, help='bootstrap replicates of the slope')
+    correct.add_argument('--workers', type=int, default=None,
+                         help='worker processes (pipeline, default: all cores) or bootstrap threads (scale-factor)')
+    correct.add_argument('--stages', nargs='+', choices=('travel-time', 'outliers', 'scale-factor'),
+                         default=('travel-time', 'outliers', 'scale-factor'), help='pipeline stages, in order')
+    correct.add_argument('--step-tolerance', type=float, default=0.05,
+                         help='relative travel-time step tolerance (pipeline)')
+    correct.add_argument('--crossover-tolerance', type=float, default=0.0167,
+                         help='crossover box half-width in degrees (pipeline)')
+    correct.set_defaults(run=run_correct)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'correct' and args.tolerance is None:
+        args.tolerance = 0.05 if args.method == 'travel-time' else 0.0167
+    if args.command == 'correct':
+        args.steps = tuple(int(step) if step == int(step) else step for step in args.steps)
+
+    output = sys.stdout
+
+    def emit(record):
+        output.write(json.dumps(json_safe({'command': args.command, **record}), allow_nan=False) + '\n')
+        output.flush()
+
+    try:
+        if not (args.report or args.profile_stage):
+            return execute(args, emit)
+        import instrumentation
+        report = instrumentation.start(args.command, args.profile_stage, args.report or args.command)
+        try:
+            code = execute(args, emit)
+        finally:
+            instrumentation.stop()
+        if args.report:
+            report.write(args.report, status='ok' if code == EXIT_OK else 'failed', exit_code=code)
+        return code
+    except BrokenPipeError:
+        # The reader of standard output went away (e.g. `| head`); silence the final flush
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return EXIT_FAILED
+
+
+def execute(args, emit):
+    """Run a parsed command and report its outcome as the last JSON record"""
+    try:
+        # Progress printed by the stages goes to standard error so standard output stays JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            code = args.run(args, emit)
+    except BrokenPipeError:
+        raise
+    except InputError as e:
+        emit({'event': 'error', 'status': 'input_error', 'error': str(e)})
+        return EXIT_INPUT
+    except KeyboardInterrupt:
+        emit({'event': 'error', 'status': 'interrupted'})
+        return EXIT_INTERRUPTED
+    except Exception as e:
+        emit({'event': 'error', 'status': 'failed', 'error': f'{type(e).__name__}: {e}'})
+        return EXIT_FAILED
+    emit({'event': 'done', 'status': 'ok' if code == EXIT_OK else 'failed', 'exit_code': code})
+    return code
+
+if __name__ == '__main__':
+    sys.exit(main())
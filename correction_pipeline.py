@@ -0,0 +1,169 @@
+"""
+Batch correction of every SID folder of a main folder in one pass per cruise.
+
+Each SID is loaded, cleaned and joined with its model depths once; the configured stages then run in order
+on the same in-memory Track, each on the points no earlier stage removed:
+
+    travel-time   remove 750 m (or other) travel-time steps; without a later outlier stage, also drop land
+                  points and misfits above the misfit threshold
+    outliers      drop large errors (land, misfit) and flag those next to large crossover errors as outliers
+    scale-factor  fit the scale factor on the remaining points and divide their depths by it
+
+Per SID the pipeline writes corrected_bathy.xyz (lon, lat, corrected depth of the kept points) and
+removed_bathy.xyz (lon, lat, depth, model depth and class flags of the removed points, see track),
+and correction_summary.json in the main folder records what each stage changed per SID.
+"""
+import os
+import json
+import concurrent.futures
+import numpy as np
+from ship_join import load_xyz
+from track import Track, DELETED, OUTLIER
+from corrections import travel_time_stage, outlier_stage, scale_factor_stage, load_crossovers
+import instrumentation
+from instrumentation import stage, count
+
+STAGES = ('travel-time', 'outliers', 'scale-factor')
+
+CORRECTED_FILE_NAME = 'corrected_bathy.xyz'
+REMOVED_FILE_NAME = 'removed_bathy.xyz'
+SUMMARY_FILE_NAME = 'correction_summary.json'
+
+# Flags are written as integers after the four depth columns
+REMOVED_FORMAT = '{} {} {} {} {:.0f}\n'
+
+
+def check_stages(stages):
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown correction stage(s): {', '.join(unknown)}")
+
+
+def finite_or_none(value):
+    """A fit result (a float or a tuple of them) with NaN replaced by None for the JSON summary"""
+    if isinstance(value, tuple):
+        return tuple(finite_or_none(v) for v in value)
+    return None if np.isnan(value) else value
+
+
+def list_correction_folders(main_folder):
+    """SID folders of a main folder with both bathy.xyz and topo.xyz"""
+    return [f for f in sorted(os.listdir(main_folder))
+            if os.path.exists(os.path.join(main_folder, f, 'bathy.xyz'))
+            and os.path.exists(os.path.join(main_folder, f, 'topo.xyz'))]
+
+
+def correct_folder(sub_folder_path, stages=STAGES, steps=(750,), step_tolerance=0.05, crossover_tolerance=0.0167,
+                   threshold=1000, misfit_threshold=1000, store=None, bootstrap=0, bootstrap_workers=1):
+    """
+    Run the correction stages on one SID folder and write its corrected and removed points.
+    Crossovers for the outlier stage come from crossover.txt or the store (see corrections.load_crossovers);
+    a folder without them only has its large errors removed. Returns the summary of every stage.
+    """
+    check_stages(stages)
+    with stage('correct.load'):
+        ship = Track.load(os.path.join(sub_folder_path, 'bathy.xyz'), os.path.basename(sub_folder_path))
+        topo = load_xyz(os.path.join(sub_folder_path, 'topo.xyz'))
+    count('points_read', len(ship))
+    with stage('correct.join'):
+        track = ship.clean().join(topo)
+    summary = {'ship_points': len(ship), 'joined_points': len(track), 'stages': {}}
+
+    removed = []
+    for position, name in enumerate(stages):
+        if name == 'travel-time':
+            # A later outlier stage classifies and removes the large errors itself
+            delete = 'outliers' not in stages[position + 1:]
+            with stage('correct.travel_time'):
+                applied_step = travel_time_stage(track, steps, step_tolerance, misfit_threshold, delete)
+            count('points_travel_time', np.count_nonzero(applied_step))
+            result = {'corrected': {step: int(np.count_nonzero(applied_step == step)) for step in steps}}
+        elif name == 'outliers':
+            with stage('correct.load'):
+                try:
+                    cross = load_crossovers(sub_folder_path, store, threshold)
+                except FileNotFoundError:
+                    cross = np.empty((0, 3))
+            with stage('correct.outliers'):
+                _, large_error, outlier = outlier_stage(track, cross, crossover_tolerance, threshold, misfit_threshold)
+            count('outliers_found', np.count_nonzero(outlier))
+            result = {'crossovers': len(cross), 'large_error': int(np.count_nonzero(large_error)),
+                      'outliers': int(np.count_nonzero(outlier))}
+        elif len(track) == 0:
+            # Nothing left to fit once the earlier stages removed every point
+            result = {'slope': None, 'r_value': None}
+        else:
+            with stage('correct.scale_factor'):
+                result = scale_factor_stage(track, bootstrap, bootstrap_workers)
+            # A degenerate fit (e.g. a single model depth) gives NaN, which JSON cannot hold
+            result = {key: finite_or_none(value) for key, value in result.items()}
+            count('points_scaled', len(track))
+
+        # Points removed by this stage leave the working set of the next ones
+        deleted = track.has(DELETED)
+        result['removed'] = int(np.count_nonzero(deleted))
+        count('points_deleted', result['removed'])
+        removed.append(track[deleted])
+        track = track[~deleted]
+        result['remaining'] = len(track)
+        summary['stages'][name] = result
+
+    with stage('correct.write'):
+        track.write(os.path.join(sub_folder_path, CORRECTED_FILE_NAME))
+        with open(os.path.join(sub_folder_path, REMOVED_FILE_NAME), 'w') as removed_file:
+            for points in removed:
+                points.write_to(removed_file, ('lon', 'lat', 'depth', 'topo', 'flags'), REMOVED_FORMAT)
+    summary['kept'] = len(track)
+    summary['removed'] = sum(len(points) for points in removed)
+    summary['outliers'] = sum(int(np.count_nonzero(points.has(OUTLIER))) for points in removed)
+    return summary
+
+
+def run_folder(main_folder, sub_folder, stages, options):
+    """Correct one SID folder, reporting any failure in its summary so the other folders still finish"""
+    try:
+        summary = correct_folder(os.path.join(main_folder, sub_folder), stages, **options)
+        summary['status'] = 'ok'
+    except Exception as e:
+        summary = {'status': 'error', 'error': f'{type(e).__name__}: {e}'}
+    return sub_folder, summary
+
+
+def correct_main_folder(main_folder, stages=STAGES, sub_folders=None, workers=None, progress=None, **options):
+    """
+    Run the correction stages on every SID folder of a main folder (or the given ones) across a pool of worker
+    processes, and write the per-SID summaries to correction_summary.json in the main folder.
+    `workers` is the pool size (all cores when None, sequential when 1); `progress(done, total, SID, summary)`
+    is called as each folder finishes. `options` are the keyword arguments of correct_folder.
+    Returns the summaries by SID.
+    """
+    check_stages(stages)
+    if sub_folders is None:
+        sub_folders = list_correction_folders(main_folder)
+    total = len(sub_folders)
+    summaries = {}
+
+    def finished(sub_folder, summary):
+        summaries[sub_folder] = summary
+        if progress:
+            progress(len(summaries), total, sub_folder, summary)
+
+    if workers == 1:
+        for sub_folder in sub_folders:
+            finished(*run_folder(main_folder, sub_folder, stages, options))
+    else:
+        settings = instrumentation.worker_settings()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(instrumentation.call, settings, run_folder, main_folder, sub_folder, stages,
+                                       options)
+                       for sub_folder in sub_folders]
+            for future in concurrent.futures.as_completed(futures):
+                result, worker_data = future.result()
+                instrumentation.merge(worker_data)
+                finished(*result)
+
+    with open(os.path.join(main_folder, SUMMARY_FILE_NAME), 'w') as summary_file:
+        json.dump({'stages': list(stages), 'options': options,
+                   'sids': {sub_folder: summaries[sub_folder] for sub_folder in sorted(summaries)}},
+                  summary_file, indent=2)
+    return summaries
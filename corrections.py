@@ -0,0 +1,308 @@
+import os
+import concurrent.futures
+import numpy as np
+from scipy.spatial import cKDTree
+from ship_join import load_xyz
+from track import Track, LAND, MISFIT, OUTLIER, TRAVEL_TIME, DELETED
+from crossover_store import CrossoverStore
+from instrumentation import stage, count
+
+
+def match_crossovers(x, y, cross, tolerance=0.0167, threshold=1000):
+    """
+    Mask of the points lying within `tolerance` degrees in both longitude and latitude
+    of a crossover whose |COE| exceeds `threshold`.
+    """
+    cross = cross[np.abs(cross[:, 2]) > threshold]
+    if len(cross) == 0 or len(x) == 0:
+        return np.zeros(len(x), dtype=bool)
+
+    # The Chebyshev distance of the KD-tree is exactly the longitude/latitude box test
+    tree = cKDTree(cross[:, :2])
+    distance, _ = tree.query(np.column_stack((x, y)), k=1, p=np.inf,
+                             distance_upper_bound=np.nextafter(tolerance, np.inf))
+    return distance <= tolerance
+
+
+def classify_points(z_ship, z_topo, misfit_threshold=1000):
+    """
+    Classify joined points in one pass over the aligned depth arrays.
+    Returns boolean masks (land, misfit, kept): model above sea level, |z_topo - z_ship| above
+    the threshold, and every other point.
+    """
+    land = z_topo > 0
+    misfit = ~land & (np.abs(z_topo - z_ship) > misfit_threshold)
+    kept = ~(land | misfit)
+    return land, misfit, kept
+
+
+def travel_time_correction(z_ship, z_topo, steps=(750,), tolerance=0.05):
+    """
+    Remove travel-time errors: ship-model differences close to an integer multiple of a step.
+    For each point the multiplier is round(|difference| / step); when |difference| lies within
+    `tolerance` of multiplier * step, the signed shift is removed from the ship depth.
+    Several step sizes (e.g. 750, 800, 1500 m) are tried in order and the first match is applied.
+    Returns the corrected depths and the step applied to each point (0 where none was).
+    """
+    difference = z_ship - z_topo
+    magnitude = np.abs(difference)
+    z_corrected = np.array(z_ship, dtype=np.float64)
+    applied_step = np.zeros(len(z_corrected))
+
+    for step in steps:
+        multiplier = np.round(magnitude / step)
+        lower = multiplier * step * (1 - tolerance)
+        upper = multiplier * step * (1 + tolerance)
+        match = (applied_step == 0) & (difference != 0) & (lower <= magnitude) & (magnitude <= upper)
+        shift = step * multiplier[match]
+        z_corrected[match] = np.where(difference[match] > 0, z_corrected[match] - shift, z_corrected[match] + shift)
+        applied_step[match] = step
+
+    return z_corrected, applied_step
+
+
+# Bootstrap weights drawn at once per thread (replicates x points of a chunk), about 32 MB of int64
+BOOTSTRAP_BLOCK_WEIGHTS = 1 << 22
+
+
+class ScaleFactorEstimator:
+    """
+    Bounded-memory regression of ship depths on model depths for the scale factor.
+    Chunks are added in ship order; only the first occurrence of each model depth (rounded to 0.1 m)
+    enters the fit, as in the list-based version. The fit keeps running sums instead of the points,
+    and centering the ship depths on their mean is left out because it only moves the intercept.
+    With `bootstrap` > 0 the same sums are kept for Poisson-weighted bootstrap replicates,
+    split across `workers` threads.
+    """
+
+    def __init__(self, bootstrap=0, workers=1, seed=None):
+        self.bootstrap = bootstrap
+        self.workers = max(1, min(workers, bootstrap)) if bootstrap else 1
+        self.rngs = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(self.workers)]
+        self.seen = np.empty(0, dtype=np.int64)
+        self.shift = None
+        # Per replicate: n, sum x, sum y, sum x^2, sum y^2, sum xy (row 0 is the actual fit)
+        self.sums = np.zeros((1 + bootstrap, 6))
+
+    def update(self, z_topo, z_ship):
+        """Add a chunk of aligned model (already rounded to 0.1 m) and ship depths"""
+        valid = ~np.isnan(z_topo)
+        z_topo, z_ship = z_topo[valid], z_ship[valid]
+
+        # First occurrence of each model depth that was not seen in an earlier chunk
+        keys = np.round(z_topo * 10).astype(np.int64)
+        _, first = np.unique(keys, return_index=True)
+        first = np.sort(first[~np.isin(keys[first], self.seen, assume_unique=True)])
+        if len(first) == 0:
+            return
+        self.seen = np.union1d(self.seen, keys[first])
+
+        x, y = z_topo[first], z_ship[first]
+        # Sums are taken around the first chunk's means to keep them well conditioned
+        if self.shift is None:
+            self.shift = (x.mean(), y.mean())
+        x = x - self.shift[0]
+        y = y - self.shift[1]
+        columns = np.column_stack((np.ones_like(x), x, y, x * x, y * y, x * y))
+        self.sums[0] += columns.sum(axis=0)
+
+        if self.bootstrap:
+            blocks = np.array_split(np.arange(1, 1 + self.bootstrap), self.workers)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+                list(executor.map(lambda rng, block: self._add_replicates(rng, block, columns), self.rngs, blocks))
+
+    def _add_replicates(self, rng, replicates, columns):
+        """
+        Add the Poisson-weighted sums of a chunk to the given replicates, drawing the weights for a few
+        replicates at a time so the weight matrix stays within BOOTSTRAP_BLOCK_WEIGHTS
+        """
+        step = max(1, BOOTSTRAP_BLOCK_WEIGHTS // max(1, len(columns)))
+        for start in range(0, len(replicates), step):
+            block = replicates[start:start + step]
+            # Each thread owns its replicates' rows, so the sums need no lock
+            self.sums[block] += rng.poisson(1.0, (len(block), len(columns))) @ columns
+
+    @staticmethod
+    def _slope_r(sums):
+        n, sx, sy, sxx, syy, sxy = sums.T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sxx_c = sxx - sx * sx / n
+            syy_c = syy - sy * sy / n
+            sxy_c = sxy - sx * sy / n
+            return sxy_c / sxx_c, sxy_c / np.sqrt(sxx_c * syy_c)
+
+    def result(self):
+        """Slope and R-value of the fit"""
+        slope, r_value = self._slope_r(self.sums[:1])
+        return float(slope[0]), float(r_value[0])
+
+    def confidence_interval(self, level=0.95):
+        """Percentile bootstrap confidence interval of the slope"""
+        if not self.bootstrap:
+            raise ValueError("The estimator was created without bootstrap replicates")
+        slopes, _ = self._slope_r(self.sums[1:])
+        tail = (1 - level) / 2 * 100
+        low, high = np.nanpercentile(slopes, [tail, 100 - tail])
+        return float(low), float(high)
+
+
+def travel_time_stage(track, steps=(750,), tolerance=0.05, misfit_threshold=1000, delete=True):
+    """
+    Travel-time correction of joined points in place. Ship depths are rounded to one decimal place and
+    corrected against the rounded model depth. Corrected points get the TRAVEL_TIME flag. With `delete`,
+    points over land, or more than `misfit_threshold` m from the unrounded model depth after the correction,
+    get the DELETED flag; without it classifying them is left to a later outlier_stage.
+    Returns the step applied to each point (0 where none was).
+    """
+    track.depth, applied_step = travel_time_correction(np.round(track.depth, 1), np.round(track.topo), steps,
+                                                       tolerance)
+    track.set_flag(TRAVEL_TIME, applied_step != 0)
+    if delete:
+        deleted = (track.topo > 0) | ((track.topo < 0) & (np.abs(track.topo - track.depth) > misfit_threshold))
+        track.set_flag(DELETED, deleted)
+    return applied_step
+
+
+def outlier_stage(track, cross, tolerance=0.0167, threshold=1000, misfit_threshold=1000):
+    """
+    Flag the large errors of joined points in place (LAND or MISFIT, and DELETED) and, among them, the OUTLIER
+    points within `tolerance` of a crossover (rows of lon, lat, COE) whose |COE| exceeds `threshold`.
+    Returns the masks (kept, large_error, outlier).
+    """
+    land, misfit, kept = classify_points(track.depth, track.topo, misfit_threshold)
+    large_error = land | misfit
+
+    # Large-error points close to a crossover with a large mismatch value are outliers
+    outlier = large_error.copy()
+    outlier[large_error] = match_crossovers(track.lon[large_error], track.lat[large_error], cross, tolerance,
+                                            threshold)
+    track.set_flag(LAND, land)
+    track.set_flag(MISFIT, misfit)
+    track.set_flag(OUTLIER, outlier)
+    track.set_flag(DELETED, large_error)
+    return kept, large_error, outlier
+
+
+def scale_factor_stage(track, bootstrap=0, bootstrap_workers=1):
+    """
+    Fit the scale factor of joined points and divide their ship depths by it, rounded to one decimal place.
+    Depths are left unchanged when the fit is degenerate (NaN slope).
+    Returns the slope, R-value and, with bootstrap replicates, the 95% confidence interval.
+    """
+    estimator = ScaleFactorEstimator(bootstrap=bootstrap, workers=bootstrap_workers)
+    estimator.update(np.round(track.topo, 1), track.depth)
+    slope, r_value = estimator.result()
+    if not np.isnan(slope):
+        track.depth = np.round(track.depth / slope, 1)
+    summary = {'slope': slope, 'r_value': r_value}
+    if bootstrap:
+        summary['confidence_interval'] = estimator.confidence_interval()
+    return summary
+
+
+def correct_travel_time(sub_folder_path, steps=(750,), tolerance=0.05):
+    """
+    Travel-time correction of one SID folder: writes newbathy.xyz and deletebathy.xyz.
+    Returns a summary with the number of points corrected per step, kept and deleted.
+    """
+    # Remove NaN or zero depths and round the ship depths to one decimal place
+    with stage('correct.load'):
+        single = Track.load(os.path.join(sub_folder_path, 'bathy.xyz'))
+        topo = load_xyz(os.path.join(sub_folder_path, 'topo.xyz'))
+    count('points_read', len(single))
+
+    # Remove integer multiples of the step from differences to the rounded model depth
+    with stage('correct.join'):
+        joined = single.clean().join(topo)
+    with stage('correct.travel_time'):
+        applied_step = travel_time_stage(joined, steps, tolerance)
+        deleted = joined.has(DELETED)
+    count('points_corrected', np.count_nonzero(applied_step))
+    count('points_deleted', np.count_nonzero(deleted))
+    with stage('correct.write'):
+        joined[~deleted].write(os.path.join(sub_folder_path, 'newbathy.xyz'))
+        joined[deleted].write(os.path.join(sub_folder_path, 'deletebathy.xyz'), ('lon', 'lat', 'depth', 'topo'))
+    return {
+        'corrected': {step: int(np.count_nonzero(applied_step == step)) for step in steps},
+        'kept': int(np.count_nonzero(~deleted)),
+        'deleted': int(np.count_nonzero(deleted)),
+    }
+
+
+def load_crossovers(sub_folder_path, store=None, threshold=None):
+    """
+    Crossovers (lon, lat, |COE|) of a SID folder from its crossover.txt, or from the crossovers of the folder's
+    SID (on either side of the pair) above `threshold` in the consolidated crossover store at `store`
+    """
+    if store is None:
+        return load_xyz(os.path.join(sub_folder_path, 'crossover.txt'))
+    with CrossoverStore(store, read_only=True) as crossover_store:
+        sid = os.path.basename(os.path.abspath(sub_folder_path))
+        return crossover_store.points(sid=sid, threshold=threshold)
+
+
+def remove_outliers(sub_folder_path, tolerance=0.0167, threshold=1000, misfit_threshold=1000, store=None):
+    """
+    Outlier detection of one folder: writes newbathy.xyz, deletebathy.xyz and outliers.xyz.
+    Crossovers are read from crossover.txt, or from the crossovers of the folder's SID (on either side of the
+    pair) in the consolidated crossover store at `store`.
+    Returns a summary with the number of ship, kept, large-error and outlier points.
+    """
+    with stage('correct.load'):
+        topo = load_xyz(os.path.join(sub_folder_path, 'topo.xyz'))
+        ship = Track.load(os.path.join(sub_folder_path, 'bathy.xyz'))
+        cross = load_crossovers(sub_folder_path, store, threshold)
+    ship_points = len(ship)
+    count('points_read', ship_points)
+
+    # Pair the valid ship points with the model values at the same XY coordinates
+    with stage('correct.join'):
+        joined = ship.clean().join(topo)
+
+    with stage('correct.outliers'):
+        # Land points and differences greater than the threshold are recorded as data with large errors
+        kept, large_error, outlier = outlier_stage(joined, cross, tolerance, threshold, misfit_threshold)
+    count('points_deleted', np.count_nonzero(large_error))
+    count('outliers_found', np.count_nonzero(outlier))
+
+    with stage('correct.write'):
+        columns = ('lon', 'lat', 'depth', 'topo')
+        joined[kept].write(os.path.join(sub_folder_path, 'newbathy.xyz'))
+        joined[large_error].write(os.path.join(sub_folder_path, 'deletebathy.xyz'), columns)
+        joined[outlier].write(os.path.join(sub_folder_path, 'outliers.xyz'), columns)
+    return {
+        'ship_points': ship_points,
+        'kept': int(np.count_nonzero(kept)),
+        'large_error': int(np.count_nonzero(large_error)),
+        'outliers': int(np.count_nonzero(outlier)),
+    }
+
+
+def correct_scale_factor(sub_folder_path, chunk_size=1000000, bootstrap=0, bootstrap_workers=1):
+    """
+    Scale factor correction of one SID folder: writes modify_bathy.xyz with the ship depths divided by the slope.
+    Returns a summary with the slope, R-value and, with bootstrap replicates, the 95% confidence interval.
+    """
+    with stage('correct.load'):
+        topo = load_xyz(os.path.join(sub_folder_path, 'topo.xyz'))
+        ship = Track.load(os.path.join(sub_folder_path, 'bathy.xyz'))
+    count('points_read', len(ship))
+
+    # Accumulate the regression of ship on topo depths chunk by chunk; NaN or zero ship depths are
+    # removed and only the first occurrence of each rounded topo value is used
+    with stage('correct.scale_factor'):
+        estimator = ScaleFactorEstimator(bootstrap=bootstrap, workers=bootstrap_workers)
+        for joined in ship.iter_joined_chunks(topo, chunk_size):
+            estimator.update(np.round(joined.topo, 1), joined.depth)
+        slope, r_value = estimator.result()
+    summary = {'ship_points': len(ship), 'slope': slope, 'r_value': r_value}
+    if bootstrap:
+        summary['confidence_interval'] = estimator.confidence_interval()
+
+    # Correct the z_ship values by dividing by the slope and write them chunk by chunk
+    with stage('correct.write'), open(os.path.join(sub_folder_path, 'modify_bathy.xyz'), 'w') as f:
+        for joined in ship.iter_joined_chunks(topo, chunk_size):
+            joined.depth = np.round(joined.depth / slope, 1)
+            joined.write_to(f)
+            count('points_corrected', len(joined))
+    return summary
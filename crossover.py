@@ -0,0 +1,369 @@
+import os
+import json
+import glob
+import shutil
+import subprocess
+import itertools
+import concurrent.futures
+import numpy as np
+from xyz_cache import update_cache, source_signature
+from xyz_io import CROSSOVER_FORMAT, write_rows, iter_line_chunks, parse_uniform, read_x2sys
+from track_index import TrackIndex, read_coordinates
+from native_cross import cross_files
+from crossover_store import CrossoverStore, store_path
+from x2sys_tag import TagDatabase, BATCH_SIZE
+import instrumentation
+from instrumentation import stage, count
+
+# Per folder A track: fingerprints of the inputs of every crossover pair computed by the last run
+MANIFEST_FILE_NAME = '.crossover_manifest.json'
+
+
+def list_sub_folders(main_folder):
+    """List the SID folders of a main folder"""
+    return [f for f in os.listdir(main_folder) if os.path.isdir(os.path.join(main_folder, f))]
+
+
+def process_comparison(task):
+    output_subfolder1, output_subfolder2, SID = task
+    inputfile = os.path.join(output_subfolder2, 'bathy.xyz')
+    outputfile = os.path.join(output_subfolder1, f'bathy_{SID}.xyz')
+    with stage('crossover.copy'):
+        shutil.copy2(inputfile, outputfile)
+
+
+def resolve_engine(engine):
+    """
+    Crossover engine to use: 'gmt', 'native', 'x2sys' for batched GMT calls against a TAG database of
+    folder B, or 'auto' for GMT when it is installed
+    """
+    if engine == "auto":
+        return "gmt" if shutil.which("gmt") else "native"
+    if engine not in ("gmt", "native", "x2sys"):
+        raise ValueError(f"Unknown crossover engine: {engine}")
+    if engine != "native" and shutil.which("gmt") is None:
+        raise ValueError(f"The {engine} crossover engine needs GMT, which is not installed")
+    return engine
+
+
+def keep_line(line):
+    parts = line.strip().split()
+    return len(parts) == 3 and parts[2].lower() not in ("0", "nan")
+
+
+def depth_lines(lines):
+    """The lines of bathy.xyz text with three columns and a depth that reads neither 0 nor NaN"""
+    points = parse_uniform("".join(lines))
+    if points is None or points.shape != (len(lines), 3):
+        return [line for line in lines if keep_line(line)]
+    z = points[:, 2]
+    keep = ~np.isnan(z) & (z != 0)
+    # Only the literal tokens 0 and NaN are dropped (not e.g. 0.0), so zero and NaN depths are checked as text
+    for i in np.flatnonzero(np.isnan(z) | (z == 0)).tolist():
+        keep[i] = keep_line(lines[i])
+    return list(itertools.compress(lines, keep.tolist()))
+
+
+def filter_bathy(folder):
+    """Write filtered.xyz: the points of bathy.xyz whose depth is neither zero nor NaN"""
+    with stage('crossover.filter'), open(os.path.join(folder, "bathy.xyz"), "r") as infile, \
+            open(os.path.join(folder, "filtered.xyz"), "w") as outfile:
+        for lines in iter_line_chunks(infile):
+            outfile.writelines(depth_lines(lines))
+
+
+def pair_result_file(filename):
+    """Per-pair crossover file of a copied track bathy_<SID>.xyz"""
+    return f"{os.path.splitext(filename)[0]}_crossover.txt"
+
+
+def cross_pairs(folder, bathy_files, engine="auto"):
+    """Compute the per-pair crossover files of filtered.xyz against copied tracks of a folder"""
+    count('pairs_computed', len(bathy_files))
+    if resolve_engine(engine) == "native":
+        # In-process segment intersection writes the same per-pair files without GMT
+        with stage('crossover.cross_native'):
+            cross_files(folder, "filtered.xyz", bathy_files)
+        return
+
+    # Loop through each file and execute the x2sys_cross command inside the folder
+    for filename in bathy_files:
+        output_file = os.path.join(folder, pair_result_file(filename))
+
+        cross_command = ["gmt", "x2sys_cross", "filtered.xyz", filename, "-Qe", "-W2", "-TXYZ"]
+        with stage('crossover.cross_gmt'), open(output_file, "w") as cross_file:
+            subprocess.run(cross_command, stdout=cross_file, cwd=folder)
+
+
+def combine_crossovers(folder, crossover_files):
+    """Combine per-pair crossover files into crossover.txt (lon, lat, |COE|)"""
+    crossover_path = os.path.join(folder, "crossover.txt")
+    found = 0
+    with stage('crossover.combine'), open(crossover_path, "w") as combined_file:
+        for file in crossover_files:
+            # lon, lat and |z_X| of the rows after the x2sys_cross header
+            rows = read_x2sys(file)
+            write_rows(combined_file, np.column_stack((rows[:, :2], np.abs(rows[:, 2]))), CROSSOVER_FORMAT)
+            found += len(rows)
+    count('crossovers_found', found)
+    update_cache(crossover_path, 3)
+
+
+def coe(folder, engine="auto"):
+    """Compute crossovers for every copied track in a folder and combine the results into crossover.txt"""
+    filter_bathy(folder)
+
+    # Find all files starting with bathy_ and ending with .xyz
+    bathy_files = [os.path.basename(f) for f in glob.glob(os.path.join(glob.escape(folder), "bathy_*.xyz"))]
+    cross_pairs(folder, bathy_files, engine)
+
+    # Process all *_crossover.txt files
+    combine_crossovers(folder, glob.glob(os.path.join(glob.escape(folder), "*_crossover.txt")))
+
+    # Pairs of an earlier incremental run no longer describe this folder's results
+    manifest_path = os.path.join(folder, MANIFEST_FILE_NAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+
+def pair_result_files(folder):
+    """Per-pair crossover files of a folder A track by folder B SID, as listed by its manifest when it has one"""
+    pairs = load_manifest(folder).get("pairs")
+    if pairs is not None:
+        return {SID: os.path.join(folder, pair_result_file(f"bathy_{SID}.xyz")) for SID in pairs}
+    return {os.path.basename(f)[len("bathy_"):-len("_crossover.txt")]: f
+            for f in glob.glob(os.path.join(glob.escape(folder), "bathy_*_crossover.txt"))}
+
+
+def store_track(store, main_folder1, sub_folder1):
+    """Replace the crossovers of a folder A track in the consolidated store with its per-pair results"""
+    folder = os.path.join(main_folder1, sub_folder1)
+    with stage('crossover.store'):
+        store.replace_track(sub_folder1, {SID: read_x2sys(path)
+                                          for SID, path in sorted(pair_result_files(folder).items())})
+
+
+def load_manifest(folder):
+    """Run manifest of a folder A track, or an empty one when it is missing or unreadable"""
+    try:
+        with open(os.path.join(folder, MANIFEST_FILE_NAME), "r") as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(folder, manifest):
+    manifest_path = os.path.join(folder, MANIFEST_FILE_NAME)
+    temporary_path = f"{manifest_path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_path, "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(temporary_path, manifest_path)
+    except OSError:
+        pass
+
+
+def same_signature(entry, signature):
+    return bool(entry) and entry.get("size") == signature["size"] and entry.get("mtime_ns") == signature["mtime_ns"]
+
+
+def incremental_coe(folder, pairs, engine="auto"):
+    """
+    Crossovers of a folder A track against its candidate tracks, recomputing only pairs whose inputs changed.
+    `pairs` maps each candidate SID to the bathy.xyz of its folder B track. A pair is reused when the
+    manifest holds the same engine, the same fingerprint (size, mtime) of both bathy.xyz files and its
+    result file still exists; crossover.txt is then rebuilt from the per-pair files of the current candidates.
+    Returns (computed, reused) pair counts.
+    """
+    engine = resolve_engine(engine)
+    manifest = load_manifest(folder)
+    bathy_signature = source_signature(os.path.join(folder, "bathy.xyz"))
+    if manifest.get("engine") != engine or not same_signature(manifest.get("bathy"), bathy_signature) or \
+            not os.path.exists(os.path.join(folder, "filtered.xyz")):
+        # A changed track A (or engine) invalidates every pair
+        filter_bathy(folder)
+        manifest = {"engine": engine, "bathy": bathy_signature, "pairs": {}}
+
+    stored_pairs = manifest.get("pairs", {})
+    current_pairs = {}
+    changed = []
+    for SID, source_path in sorted(pairs.items()):
+        signature = source_signature(source_path)
+        filename = f"bathy_{SID}.xyz"
+        if same_signature(stored_pairs.get(SID), signature) and \
+                os.path.exists(os.path.join(folder, pair_result_file(filename))):
+            current_pairs[SID] = stored_pairs[SID]
+            continue
+        with stage('crossover.copy'):
+            shutil.copy2(source_path, os.path.join(folder, filename))
+        changed.append(filename)
+        current_pairs[SID] = signature
+
+    cross_pairs(folder, changed, engine)
+    combine_crossovers(folder, [os.path.join(folder, pair_result_file(f"bathy_{SID}.xyz")) for SID in current_pairs])
+
+    manifest["pairs"] = current_pairs
+    save_manifest(folder, manifest)
+    count('pairs_reused', len(current_pairs) - len(changed))
+    return len(changed), len(current_pairs) - len(changed)
+
+
+def overlap_candidates(sub_folder1, coordinates_file1, sub_folders2, track_index):
+    """Folder B tracks coming close enough to a folder A track to cross it"""
+    # Only tracks with a segment box overlapping a segment box of this track can cross it
+    with stage('crossover.overlap'):
+        coordinates1 = read_coordinates(coordinates_file1)
+        candidates = [sub_folder2 for sub_folder2 in track_index.query_track(coordinates1)
+                      if sub_folder1 != sub_folder2]
+    count('pairs_considered', len(sub_folders2) - (sub_folder1 in sub_folders2))
+    count('pairs_overlapping', len(candidates))
+    return candidates
+
+
+def process_folder(sub_folder1, main_folder1, main_folder2, sub_folders2, track_index=None, engine="auto",
+                   incremental=True):
+    output_subfolder1 = os.path.join(main_folder1, sub_folder1)
+    print(f'Currently processing folder: {output_subfolder1}')
+    coordinates_file1 = os.path.join(output_subfolder1, 'lon_lat.txt')
+
+    # Build the segment index of folder B unless the caller shares one across folders
+    if track_index is None:
+        track_index = TrackIndex.build(main_folder2, sub_folders2)
+    candidates = overlap_candidates(sub_folder1, coordinates_file1, sub_folders2, track_index)
+
+    if incremental:
+        # Only pairs that are new or whose inputs changed since the last run are recomputed
+        computed, reused = incremental_coe(
+            output_subfolder1, {SID: os.path.join(main_folder2, SID, 'bathy.xyz') for SID in candidates}, engine)
+        print(f'{sub_folder1}: {computed} pairs computed, {reused} reused')
+        return sub_folder1
+
+    tasks = [(output_subfolder1, os.path.join(main_folder2, sub_folder2), sub_folder2) for sub_folder2 in candidates]
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        list(executor.map(process_comparison, tasks))
+
+    # Run the `coe` function to complete `x2sys_cross` and subsequent processing
+    coe(output_subfolder1, engine)
+    return sub_folder1
+
+
+def analyze_folders(main_folder1, main_folder2, workers=None, progress=None, engine="auto", incremental=True):
+    """
+    Crossover analysis of every track in folder A against folder B, one process per A track.
+    `workers` is the pool size (all cores when None, sequential when 1); `progress(done, total, sub_folder)`
+    is called in the parent process as each track finishes. `engine` selects GMT, the native engine or the
+    x2sys TAG database mode, where `workers` bounds the concurrent GMT calls instead.
+    With `incremental`, pairs whose inputs are unchanged since the last run are reused from their cached results.
+    Every result is also written to the consolidated crossover store of folder A (see crossover_store).
+    """
+    engine = resolve_engine(engine)
+    sub_folders1 = list_sub_folders(main_folder1)
+    sub_folders2 = list_sub_folders(main_folder2)
+
+    # Index the bounding boxes of folder B once for the whole run
+    with stage('crossover.index'):
+        track_index = TrackIndex.build(main_folder2, sub_folders2)
+
+    if engine == "x2sys":
+        analyze_folders_tag(main_folder1, main_folder2, sub_folders1, sub_folders2, track_index, workers, progress)
+        return
+
+    total = len(sub_folders1)
+    # Only this process writes to the store, as each track finishes
+    with CrossoverStore(store_path(main_folder1)) as store:
+        if workers == 1:
+            for done, sub_folder1 in enumerate(sub_folders1, start=1):
+                process_folder(sub_folder1, main_folder1, main_folder2, sub_folders2, track_index, engine, incremental)
+                store_track(store, main_folder1, sub_folder1)
+                if progress:
+                    progress(done, total, sub_folder1)
+            return
+
+        settings = instrumentation.worker_settings()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(instrumentation.call, settings, process_folder, sub_folder1, main_folder1,
+                                main_folder2, sub_folders2, track_index, engine, incremental)
+                for sub_folder1 in sub_folders1
+            ]
+            for done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+                sub_folder1, worker_data = future.result()
+                instrumentation.merge(worker_data)
+                store_track(store, main_folder1, sub_folder1)
+                if progress:
+                    progress(done, total, sub_folder1)
+
+
+def write_crossovers(folder, pairs):
+    """Write crossover.txt (lon, lat, |COE|) from the crossover rows of each pair"""
+    crossover_path = os.path.join(folder, "crossover.txt")
+    found = 0
+    with stage('crossover.combine'), open(crossover_path, "w") as combined_file:
+        for SID, rows in sorted(pairs.items()):
+            write_rows(combined_file, np.column_stack((rows[:, :2], np.abs(rows[:, 2]))), CROSSOVER_FORMAT)
+            found += len(rows)
+    count('crossovers_found', found)
+    update_cache(crossover_path, 3)
+
+
+def cross_batch(database, track_file, SIDs):
+    with stage('crossover.cross_x2sys'):
+        return database.cross(track_file, SIDs)
+
+
+def analyze_folders_tag(main_folder1, main_folder2, sub_folders1, sub_folders2, track_index, workers=None,
+                        progress=None):
+    """
+    Crossover analysis against the x2sys TAG database of folder B.
+    Folder B is registered once (and afterwards only its changed tracks); each folder A track is then crossed
+    with its candidates in batches of BATCH_SIZE tracks per x2sys_cross call, with at most `workers` calls
+    running at a time. Results go straight to crossover.txt and the store, without per-pair files.
+    """
+    database = TagDatabase(main_folder2)
+    with stage('crossover.tag_register'):
+        registered = database.update(sub_folders2)
+    print(f'{registered} tracks of {main_folder2} registered in the x2sys database')
+
+    total = len(sub_folders1)
+    finished = []
+
+    def finish(sub_folder1, pairs):
+        write_crossovers(os.path.join(main_folder1, sub_folder1), pairs)
+        with stage('crossover.store'):
+            store.replace_track(sub_folder1, pairs)
+        finished.append(sub_folder1)
+        if progress:
+            progress(len(finished), total, sub_folder1)
+
+    with CrossoverStore(store_path(main_folder1)) as store, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        owner = {}
+        pending = {}
+        for sub_folder1 in sub_folders1:
+            folder = os.path.join(main_folder1, sub_folder1)
+            print(f'Currently processing folder: {folder}')
+            filter_bathy(folder)
+            candidates = overlap_candidates(sub_folder1, os.path.join(folder, 'lon_lat.txt'), sub_folders2,
+                                            track_index)
+            candidates = [SID for SID in candidates if SID in database.registered]
+            count('pairs_computed', len(candidates))
+            # This run's pairs replace any per-pair results of an earlier incremental run
+            manifest_path = os.path.join(folder, MANIFEST_FILE_NAME)
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+            if not candidates:
+                finish(sub_folder1, {})
+                continue
+            pending[sub_folder1] = ({}, len(candidates))
+            for start in range(0, len(candidates), BATCH_SIZE):
+                future = executor.submit(cross_batch, database, os.path.join(folder, "filtered.xyz"),
+                                         candidates[start:start + BATCH_SIZE])
+                owner[future] = sub_folder1
+
+        # A track is written as soon as its last batch finishes
+        for future in concurrent.futures.as_completed(owner):
+            sub_folder1 = owner[future]
+            pairs, expected = pending[sub_folder1]
+            pairs.update(future.result())
+            if len(pairs) == expected:
+                finish(sub_folder1, pending.pop(sub_folder1)[0])
@@ -0,0 +1,157 @@
+import os
+import sqlite3
+import urllib.parse
+import numpy as np
+from xyz_io import CROSSOVER_FORMAT, write_xyz
+
+# Consolidated store of a crossover run, kept in folder A next to the SID folders
+STORE_FILE_NAME = 'crossovers.sqlite'
+
+RECORD_DTYPE = np.dtype([('sid1', object), ('sid2', object), ('lon', np.float64), ('lat', np.float64),
+                         ('coe', np.float64), ('depth1', np.float64), ('depth2', np.float64)])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS crossovers (
+    id INTEGER PRIMARY KEY,
+    sid1 TEXT NOT NULL,
+    sid2 TEXT NOT NULL,
+    lon REAL NOT NULL,
+    lat REAL NOT NULL,
+    coe REAL NOT NULL,
+    depth1 REAL NOT NULL,
+    depth2 REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS crossovers_sid1 ON crossovers (sid1);
+CREATE INDEX IF NOT EXISTS crossovers_sid2 ON crossovers (sid2);
+CREATE INDEX IF NOT EXISTS crossovers_abs_coe ON crossovers (abs(coe));
+"""
+
+
+def store_path(main_folder):
+    return os.path.join(main_folder, STORE_FILE_NAME)
+
+
+class CrossoverStore:
+    """
+    SQLite store of every crossover of a run: the track pair (sid1 = folder A track, sid2 = folder B track),
+    position, signed COE (z1 - z2) and the depth on both tracks.
+    Positions are indexed with an R*Tree on 0-360 longitudes, with a plain index where SQLite lacks the module.
+    With `read_only` an existing store is opened for queries only: a missing file raises sqlite3.OperationalError
+    instead of creating an empty store, and read-only folders work.
+    """
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        if read_only:
+            self.connection = sqlite3.connect(f'file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro', uri=True)
+            self.rtree = self.connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'crossovers_rtree'").fetchone() is not None
+            return
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        try:
+            self.connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS crossovers_rtree "
+                                    "USING rtree(id, min_lon, max_lon, min_lat, max_lat)")
+            self.rtree = True
+        except sqlite3.OperationalError:
+            self.connection.execute("CREATE INDEX IF NOT EXISTS crossovers_position ON crossovers (lat, lon)")
+            self.rtree = False
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def replace_track(self, sid1, pairs):
+        """
+        Replace the crossovers of a folder A track.
+        `pairs` maps each folder B SID to rows of (lon, lat, z_X, z_M) as written by x2sys_cross, where
+        z_X = z1 - z2 and z_M = (z1 + z2) / 2, so the track depths are z_M + z_X / 2 and z_M - z_X / 2.
+        """
+        with self.connection:
+            if self.rtree:
+                self.connection.execute(
+                    "DELETE FROM crossovers_rtree WHERE id IN (SELECT id FROM crossovers WHERE sid1 = ?)", (sid1,))
+            self.connection.execute("DELETE FROM crossovers WHERE sid1 = ?", (sid1,))
+            for sid2, rows in pairs.items():
+                rows = np.asarray(rows, dtype=np.float64).reshape(-1, 4)
+                if len(rows) == 0:
+                    continue
+                lon, lat, z_x, z_m = rows.T
+                first_id = self.connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM crossovers").fetchone()[0]
+                ids = range(first_id, first_id + len(rows))
+                self.connection.executemany(
+                    "INSERT INTO crossovers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    zip(ids, [sid1] * len(rows), [sid2] * len(rows), lon.tolist(), lat.tolist(), z_x.tolist(),
+                        (z_m + z_x / 2).tolist(), (z_m - z_x / 2).tolist()))
+                if self.rtree:
+                    lon360 = (lon % 360).tolist()
+                    lat = lat.tolist()
+                    self.connection.executemany("INSERT INTO crossovers_rtree VALUES (?, ?, ?, ?, ?)",
+                                                zip(ids, lon360, lon360, lat, lat))
+
+    def query(self, region=None, sid=None, threshold=None):
+        """
+        Crossovers as a structured array with the fields of RECORD_DTYPE.
+        `region` is (min_lon, max_lon, min_lat, max_lat) in either longitude convention and may cross
+        the 0 meridian; `sid` selects crossovers with that track on either side; `threshold` keeps |COE| above it.
+        """
+        conditions = []
+        parameters = []
+        if region is not None:
+            min_lon, max_lon, min_lat, max_lat = region
+            if max_lon - min_lon >= 360:
+                ranges = [(0, 360)]
+            else:
+                min_lon, max_lon = min_lon % 360, max_lon % 360
+                ranges = [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 360), (0, max_lon)]
+            if self.rtree:
+                boxes = " OR ".join("(min_lon <= ? AND max_lon >= ? AND min_lat <= ? AND max_lat >= ?)"
+                                    for _ in ranges)
+                conditions.append(f"id IN (SELECT id FROM crossovers_rtree WHERE {boxes})")
+                for low, high in ranges:
+                    parameters += [high, low, max_lat, min_lat]
+            else:
+                conditions.append("lat BETWEEN ? AND ?")
+                parameters += [min_lat, max_lat]
+                conditions.append("(" + " OR ".join("((lon % 360 + 360) % 360 BETWEEN ? AND ?)"
+                                                    for _ in ranges) + ")")
+                for low, high in ranges:
+                    parameters += [low, high]
+        if sid is not None:
+            conditions.append("(sid1 = ? OR sid2 = ?)")
+            parameters += [sid, sid]
+        if threshold is not None:
+            conditions.append("abs(coe) > ?")
+            parameters.append(threshold)
+
+        sql = "SELECT sid1, sid2, lon, lat, coe, depth1, depth2 FROM crossovers"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        rows = self.connection.execute(sql + " ORDER BY id", parameters).fetchall()
+        return np.array(rows, dtype=RECORD_DTYPE) if rows else np.empty(0, dtype=RECORD_DTYPE)
+
+    def points(self, region=None, sid=None, threshold=None):
+        """(lon, lat, |COE|) rows, the layout of crossover.txt"""
+        records = self.query(region, sid, threshold)
+        return np.column_stack((records['lon'], records['lat'], np.abs(records['coe'])))
+
+    def write_points(self, path, sid):
+        """Write the crossovers of a track in the format of crossover.txt, e.g. for plotting with GMT"""
+        write_xyz(path, self.points(sid=sid), CROSSOVER_FORMAT)
+
+    def contains(self, sid):
+        """Whether a track appears in the store, on either side of a pair"""
+        row = self.connection.execute("SELECT EXISTS (SELECT 1 FROM crossovers WHERE sid1 = ?) OR "
+                                      "EXISTS (SELECT 1 FROM crossovers WHERE sid2 = ?)", (sid, sid)).fetchone()
+        return row[0] == 1
+
+    def sids(self):
+        """Every track that appears in the store"""
+        rows = self.connection.execute("SELECT sid1 FROM crossovers UNION SELECT sid2 FROM crossovers").fetchall()
+        return sorted(row[0] for row in rows)
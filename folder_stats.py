@@ -0,0 +1,156 @@
+import os
+import threading
+import concurrent.futures
+from collections import OrderedDict
+import numpy as np
+from ship_join import load_xyz
+from track import Track
+from crossover_store import CrossoverStore, store_path
+from instrumentation import stage, count
+
+# Crossovers of a SID taken from the consolidated store of the statistics folder, when it has one
+STORE_EXPORT_FILE_NAME = 'crossover_store.txt'
+
+
+def list_statistics_folders(statistics_folder_path):
+    """SID folders of the main folder that contain both bathy.xyz and topo.xyz"""
+    sub_folders = [f for f in os.listdir(statistics_folder_path) if
+                   os.path.isdir(os.path.join(statistics_folder_path, f))]
+    return [f for f in sorted(sub_folders)
+            if os.path.exists(os.path.join(statistics_folder_path, f, "bathy.xyz"))
+            and os.path.exists(os.path.join(statistics_folder_path, f, "topo.xyz"))]
+
+
+def load_folder_data(statistics_folder_path, sub_folder):
+    """
+    Load the statistics data of one SID folder.
+    Returns (Topo, Ship, longitudes, latitudes, CrossoverFile), or None when no ship point matches the model.
+    """
+    sub_folder_path = os.path.join(statistics_folder_path, sub_folder)
+    with stage('stats.load'):
+        ship = Track.load(os.path.join(sub_folder_path, "bathy.xyz"), sub_folder)
+        topo = load_xyz(os.path.join(sub_folder_path, "topo.xyz"))
+    count('points_read', len(ship))
+    crossover_file_path = os.path.join(sub_folder_path, "crossover.txt")  # Assume crossover file path
+    store_file_path = store_path(statistics_folder_path)
+    if os.path.exists(store_file_path):
+        # Crossovers of the SID on either side of a pair, exported for GMT when the store has changed.
+        # A SID the store does not know (e.g. a store of another folder A) keeps its crossover.txt.
+        export_file_path = os.path.join(sub_folder_path, STORE_EXPORT_FILE_NAME)
+        if not os.path.exists(export_file_path) or \
+                os.path.getmtime(export_file_path) < os.path.getmtime(store_file_path):
+            with stage('stats.store_export'), CrossoverStore(store_file_path, read_only=True) as store:
+                if store.contains(sub_folder):
+                    store.write_points(export_file_path, sub_folder)
+                elif os.path.exists(export_file_path):
+                    os.remove(export_file_path)
+        if os.path.exists(export_file_path):
+            crossover_file_path = export_file_path
+
+    # Pair ship and model depths at identical coordinates
+    with stage('stats.join'):
+        joined = ship.join(topo)
+    if len(joined) == 0:
+        return None
+
+    CrossoverFile = crossover_file_path if os.path.exists(crossover_file_path) else None
+    return joined.topo, joined.depth, ship.lon, ship.lat, CrossoverFile
+
+
+def folder_statistics(statistics_folder_path, sub_folder):
+    """
+    Summary of one SID folder without plotting: matched points, ship - model differences and crossover errors.
+    Returns None when no ship point matches the model.
+    """
+    data = load_folder_data(statistics_folder_path, sub_folder)
+    if data is None:
+        return None
+    Topo, Ship, _, _, CrossoverFile = data
+    difference = Ship - Topo
+    summary = {
+        'points': len(Ship),
+        'mean_difference': float(np.nanmean(difference)),
+        'std_difference': float(np.nanstd(difference)),
+        'rms_difference': float(np.sqrt(np.nanmean(difference ** 2))),
+        'crossovers': 0,
+        'crossover_file': CrossoverFile,
+    }
+    if CrossoverFile is not None:
+        coe = load_xyz(CrossoverFile)[:, 2]
+        summary['crossovers'] = len(coe)
+        if len(coe):
+            summary['mean_abs_coe'] = float(np.mean(np.abs(coe)))
+            summary['max_abs_coe'] = float(np.max(np.abs(coe)))
+    return summary
+
+
+class FolderDataCache:
+    """Bounded LRU cache of folder statistics data, loaded on demand by background workers"""
+
+    def __init__(self, statistics_folder_path, max_entries=16, workers=2):
+        self.statistics_folder_path = statistics_folder_path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def get(self, sub_folder):
+        """Cached data of a folder, or None when it has not been loaded yet"""
+        with self.lock:
+            if sub_folder not in self.entries:
+                return None
+            self.entries.move_to_end(sub_folder)
+            return self.entries[sub_folder]
+
+    def put(self, sub_folder, data):
+        """Store data for a folder, evicting the least recently used entries"""
+        with self.lock:
+            self.entries[sub_folder] = data
+            self.entries.move_to_end(sub_folder)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def contains(self, sub_folder):
+        with self.lock:
+            return sub_folder in self.entries
+
+    def _load(self, sub_folder):
+        """Data of a folder, or the exception that stopped it from loading (not cached, so it can be retried)"""
+        try:
+            data = load_folder_data(self.statistics_folder_path, sub_folder)
+        except Exception as e:
+            print(f'Failed to load {sub_folder}: {e}')
+            return e
+        finally:
+            with self.lock:
+                self.pending.pop(sub_folder, None)
+        self.put(sub_folder, data)
+        return data
+
+    def request(self, sub_folder, callback=None):
+        """
+        Load a folder in the background unless it is cached or already loading.
+        `callback(sub_folder, data)` is called from the worker thread once the data is available; data is
+        None for a folder without matching points and the exception raised when loading failed.
+        """
+        with self.lock:
+            future = self.pending.get(sub_folder)
+            if future is None and sub_folder not in self.entries:
+                future = self.executor.submit(self._load, sub_folder)
+                self.pending[sub_folder] = future
+        if future is None:
+            if callback:
+                callback(sub_folder, self.get(sub_folder))
+            return
+        if callback:
+            future.add_done_callback(lambda f: callback(sub_folder, None if f.cancelled() else f.result()))
+
+    def prefetch(self, sub_folders):
+        """Start loading folders that are likely to be viewed next"""
+        for sub_folder in sub_folders:
+            if not self.contains(sub_folder):
+                self.request(sub_folder)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,211 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+import numpy as np
+from xyz_cache import source_signature
+
+try:
+    import netCDF4
+except ImportError:  # GMT grids in netCDF-3 format can still be read through SciPy
+    netCDF4 = None
+
+# Names tried, in order, for the data variable and the coordinate variables of a grid
+Z_NAMES = ('z', 'elevation', 'Band1', 'topo', 'depth')
+X_NAMES = ('x', 'lon', 'longitude')
+Y_NAMES = ('y', 'lat', 'latitude')
+
+# Rows converted per block when a grid is first unpacked into its memory-mapped cache
+CONVERT_ROWS = 1024
+
+# Unpacked grids of read-only model folders go to this per-user cache folder instead
+GRID_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                              'bathymetry-grids')
+
+# Grids already opened by this process, so each worker opens a model once
+_open_grids = {}
+
+
+def _pick(names, candidates):
+    for name in candidates:
+        if name in names:
+            return name
+    return None
+
+
+def _read_netcdf(grid_path):
+    """
+    Return (x, y, read_rows, dataset) for a netCDF grid; read_rows(r0, r1) gives float32 rows with NaN for
+    missing nodes while the dataset is open. The caller closes the dataset.
+    """
+    if netCDF4 is not None:
+        dataset = netCDF4.Dataset(grid_path, 'r')
+        variables = dataset.variables
+    else:
+        from scipy.io import netcdf_file
+        dataset = netcdf_file(grid_path, 'r', mmap=False, maskandscale=True)
+        variables = dataset.variables
+
+    z_name = _pick(variables, Z_NAMES) or next(
+        name for name, variable in variables.items() if len(variable.dimensions) == 2)
+    z = variables[z_name]
+    y_dim, x_dim = z.dimensions
+    x_name = x_dim if x_dim in variables else _pick(variables, X_NAMES)
+    y_name = y_dim if y_dim in variables else _pick(variables, Y_NAMES)
+    x = np.array(variables[x_name][:], dtype=np.float64)
+    y = np.array(variables[y_name][:], dtype=np.float64)
+
+    def read_rows(r0, r1):
+        rows = z[r0:r1]
+        if np.ma.isMaskedArray(rows):
+            rows = rows.filled(np.nan)
+        return np.array(rows, dtype=np.float32)
+
+    return x, y, read_rows, dataset
+
+
+def cache_locations(grid_path, signature):
+    """
+    Paths tried for the unpacked array of a grid: next to the grid, then in GRID_CACHE_DIR under a name
+    derived from the grid's path, size and modification time
+    """
+    key = hashlib.sha256(f"{os.path.abspath(grid_path)}:{signature['size']}:{signature['mtime_ns']}".encode())
+    return [grid_path + '.npy', os.path.join(GRID_CACHE_DIR, f'{key.hexdigest()[:32]}.npy')]
+
+
+def load_unpacked(array_path, signature):
+    """(x, y, memory-mapped z) of an unpacked grid, or None when it is missing or stale"""
+    meta_path = array_path + '.json'
+    if not os.path.exists(array_path) or not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, 'r') as meta_file:
+            meta = json.load(meta_file)
+        if meta['size'] == signature['size'] and meta['mtime_ns'] == signature['mtime_ns']:
+            return np.array(meta['x']), np.array(meta['y']), np.load(array_path, mmap_mode='r')
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def unpack_grid(grid_path):
+    """
+    Unpack a grid once into a float32 .npy file next to it, memory-mapped by every process that samples it.
+    When the model folder is read-only the file goes to the user cache folder instead (see cache_locations).
+    The cache is rebuilt when the size or modification time of the grid changes.
+    Raises OSError when neither location is writable.
+    """
+    signature = source_signature(grid_path)
+    locations = cache_locations(grid_path, signature)
+    for array_path in locations:
+        unpacked = load_unpacked(array_path, signature)
+        if unpacked is not None:
+            return unpacked
+
+    x, y, read_rows, dataset = _read_netcdf(grid_path)
+    try:
+        for array_path in locations:
+            # Process-specific temporary name so concurrent unpacking never mixes two writers
+            temporary_path = f'{array_path}.{os.getpid()}.tmp'
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(array_path)), exist_ok=True)
+                z = np.lib.format.open_memmap(temporary_path, mode='w+', dtype=np.float32, shape=(len(y), len(x)))
+            except OSError:
+                continue
+            for r0 in range(0, len(y), CONVERT_ROWS):
+                z[r0:r0 + CONVERT_ROWS] = read_rows(r0, min(r0 + CONVERT_ROWS, len(y)))
+            z.flush()
+            del z
+            os.replace(temporary_path, array_path)
+            signature['x'] = x.tolist()
+            signature['y'] = y.tolist()
+            with open(array_path + '.json', 'w') as meta_file:
+                json.dump(signature, meta_file)
+            return x, y, np.load(array_path, mmap_mode='r')
+    finally:
+        dataset.close()
+    raise OSError(f'No writable folder for the unpacked grid of {grid_path}')
+
+
+class GridSampler:
+    """Bilinear sampling of a bathymetric model through a per-process LRU cache of grid tiles"""
+
+    def __init__(self, x, y, z, tile_size=256, max_tiles=64):
+        # Store rows south to north so node indices grow with latitude
+        if y[0] > y[-1]:
+            y = y[::-1]
+            z = z[::-1]
+        self.z = z
+        self.ny, self.nx = z.shape
+        self.x0, self.y0 = x[0], y[0]
+        self.dx = (x[-1] - x[0]) / (self.nx - 1)
+        self.dy = (y[-1] - y[0]) / (self.ny - 1)
+        # Pixel-registered global grids wrap from the last column back to the first
+        self.periodic = abs(self.nx * self.dx - 360) < self.dx * 1e-3
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.tiles = OrderedDict()
+
+    def _tile(self, tile_row, tile_col):
+        """Tile of nodes with one extra row and column so every cell inside it can be interpolated"""
+        key = (tile_row, tile_col)
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.tiles.move_to_end(key)
+            return tile
+        r0, c0 = tile_row * self.tile_size, tile_col * self.tile_size
+        r1 = min(r0 + self.tile_size + 1, self.ny)
+        c1 = min(c0 + self.tile_size + 1, self.nx)
+        tile = np.array(self.z[r0:r1, c0:c1], dtype=np.float64)
+        if self.periodic and c0 + self.tile_size + 1 > self.nx:
+            tile = np.hstack((tile, np.array(self.z[r0:r1, :1], dtype=np.float64)))
+        self.tiles[key] = tile
+        if len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+        return tile
+
+    def sample(self, lon, lat):
+        """
+        Model values at the given points, NaN outside the grid.
+        Longitudes are brought into the grid's convention (0-360 or -180/180) before sampling.
+        """
+        lon = self.x0 + np.mod(np.asarray(lon, dtype=np.float64) - self.x0, 360)
+        col = (lon - self.x0) / self.dx
+        row = (np.asarray(lat, dtype=np.float64) - self.y0) / self.dy
+        last_col = self.nx if self.periodic else self.nx - 1
+        # Points on the last node line interpolate inside the cell before it
+        inside = (col >= 0) & (col <= last_col) & (row >= 0) & (row <= self.ny - 1)
+        result = np.full(len(lon), np.nan)
+
+        index = np.flatnonzero(inside)
+        col0 = np.minimum(np.floor(col[index]).astype(np.int64), last_col - 1)
+        row0 = np.minimum(np.floor(row[index]).astype(np.int64), self.ny - 2)
+        fx = col[index] - col0
+        fy = row[index] - row0
+
+        tile_rows = row0 // self.tile_size
+        tile_cols = col0 // self.tile_size
+        tile_keys = tile_rows * (self.nx // self.tile_size + 1) + tile_cols
+        order = np.argsort(tile_keys, kind='stable')
+        boundaries = np.flatnonzero(np.diff(tile_keys[order])) + 1
+        for group in np.split(order, boundaries):
+            if len(group) == 0:
+                continue
+            tile_row, tile_col = tile_rows[group[0]], tile_cols[group[0]]
+            tile = self._tile(tile_row, tile_col)
+            r = row0[group] - tile_row * self.tile_size
+            c = col0[group] - tile_col * self.tile_size
+            gx, gy = fx[group], fy[group]
+            result[index[group]] = ((tile[r, c] * (1 - gx) + tile[r, c + 1] * gx) * (1 - gy) +
+                                    (tile[r + 1, c] * (1 - gx) + tile[r + 1, c + 1] * gx) * gy)
+        return result
+
+
+def open_grid(grid_path, tile_size=256, max_tiles=64):
+    """Sampler for a model file, opened once per process"""
+    key = os.path.abspath(grid_path)
+    sampler = _open_grids.get(key)
+    if sampler is None:
+        sampler = GridSampler(*unpack_grid(grid_path), tile_size=tile_size, max_tiles=max_tiles)
+        _open_grids[key] = sampler
+    return sampler
@@ -0,0 +1,232 @@
+"""
+Per-stage timers, counters and memory use for a run, written as a JSON report.
+
+Stage code calls `stage(name)` and `count(name, n)`; both do nothing unless a report is active, so
+the instrumentation costs nothing in normal use. Work done in pool workers is collected by submitting
+it through `call(worker_settings(), function, *args)` and merging the returned data in the parent.
+A single stage can also be profiled with cProfile; its statistics go to <prefix>.<stage>.<pid>.prof.
+"""
+import os
+import json
+import time
+import cProfile
+import threading
+import contextlib
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Report of the run in progress in this process, if any
+_active = None
+
+# One profiler per profiled stage and process; it accumulates over every call of the stage
+_profilers = {}
+_profiling = threading.Lock()
+
+
+def peak_memory_mb(who='self'):
+    """Peak resident memory of this process ('self') or of its finished child processes ('children'), in MB"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if os.uname().sysname == 'Darwin' else 1024
+    return usage.ru_maxrss * scale / 2 ** 20
+
+
+def resident_memory_mb():
+    """Current resident memory of this process in MB, from /proc (None where it is not available)"""
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def children_cpu_seconds():
+    """CPU time of finished child processes such as GMT"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Report:
+    """Timers, counters and peak memory of one run"""
+
+    def __init__(self, name, profile_stage=None, profile_prefix=None):
+        self.name = name
+        self.profile_stage = profile_stage
+        self.profile_prefix = profile_prefix or name
+        self.stages = {}
+        self.counters = {}
+        self.worker_peak_memory_mb = None
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self.children_cpu_start = children_cpu_seconds()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time a block as stage `name`; stages may nest and repeat, their times add up"""
+        profiler = None
+        # Only one call of the stage is profiled at a time, e.g. when threads run it concurrently
+        if name == self.profile_stage and _profiling.acquire(blocking=False):
+            profiler = _profilers.setdefault((self.profile_prefix, name), cProfile.Profile())
+            profiler.enable()
+        wall, cpu, rss = time.perf_counter(), time.process_time(), resident_memory_mb()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            if profiler is not None:
+                profiler.disable()
+                # Rewritten after each call so the file always holds every call of this process so far
+                profiler.dump_stats(f'{self.profile_prefix}.{name}.{os.getpid()}.prof')
+                _profiling.release()
+            end_rss = resident_memory_mb()
+            self._add_stage(name, {'calls': 1, 'wall_seconds': wall, 'cpu_seconds': cpu,
+                                   'rss_growth_mb': None if rss is None or end_rss is None else end_rss - rss,
+                                   'process_peak_memory_mb': peak_memory_mb()})
+
+    def _add_stage(self, name, timing):
+        with self.lock:
+            entry = self.stages.setdefault(name, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                                  'rss_growth_mb': None, 'process_peak_memory_mb': None})
+            entry['calls'] += timing['calls']
+            entry['wall_seconds'] += timing['wall_seconds']
+            entry['cpu_seconds'] += timing['cpu_seconds']
+            entry['rss_growth_mb'] = _max(entry['rss_growth_mb'], timing['rss_growth_mb'])
+            entry['process_peak_memory_mb'] = _max(entry['process_peak_memory_mb'], timing['process_peak_memory_mb'])
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def merge(self, data):
+        """Add the stages and counters collected by a worker process"""
+        if not data:
+            return
+        for name, timing in data['stages'].items():
+            self._add_stage(name, timing)
+        for name, n in data['counters'].items():
+            self.count(name, n)
+        with self.lock:
+            self.worker_peak_memory_mb = _max(self.worker_peak_memory_mb, data['peak_memory_mb'])
+
+    def to_dict(self):
+        children_cpu = children_cpu_seconds()
+        with self.lock:
+            return {
+                'name': self.name,
+                'started': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(self.started)),
+                'wall_seconds': time.perf_counter() - self.wall_start,
+                'cpu_seconds': time.process_time() - self.cpu_start,
+                'children_cpu_seconds': None if children_cpu is None else children_cpu - self.children_cpu_start,
+                'peak_memory_mb': peak_memory_mb(),
+                'worker_peak_memory_mb': self.worker_peak_memory_mb,
+                'children_peak_memory_mb': peak_memory_mb('children'),
+                # Stage times of pool workers are summed, so they can exceed the run's wall time.
+                # rss_growth_mb is the largest change of resident memory over one call of the stage;
+                # process_peak_memory_mb is the process's high-water mark when the stage ended, so it
+                # is cumulative and includes the peaks of every earlier stage
+                'stages': {name: dict(timing) for name, timing in self.stages.items()},
+                'counters': dict(self.counters),
+            }
+
+    def write(self, path, **extra):
+        report = self.to_dict()
+        report.update(extra)
+        with open(path, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+
+
+def _max(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+def start(name, profile_stage=None, profile_prefix=None):
+    """Make a new report the active one of this process"""
+    global _active
+    _active = Report(name, profile_stage, profile_prefix)
+    return _active
+
+
+def stop():
+    """Deactivate and return the active report"""
+    global _active
+    report, _active = _active, None
+    return report
+
+
+def active():
+    return _active
+
+
+def stage(name):
+    """Time a block in the active report; a no-op without one"""
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.stage(name)
+
+
+def count(name, n=1):
+    """Add to a counter of the active report; a no-op without one"""
+    if _active is not None:
+        _active.count(name, n)
+
+
+def worker_settings():
+    """Picklable settings that let pool workers collect data for the active report, or None"""
+    if _active is None:
+        return None
+    return _active.name, _active.profile_stage, _active.profile_prefix
+
+
+def call(settings, function, *args):
+    """
+    Run a function in a pool worker, collecting its stages and counters when `settings` is not None.
+    Returns (result, data) where data is merged into the parent's report with `merge`.
+    """
+    if settings is None:
+        return function(*args), None
+    report = start(*settings)
+    try:
+        result = function(*args)
+    finally:
+        stop()
+    data = report.to_dict()
+    return result, data
+
+
+def merge(data):
+    """Merge worker data into the active report"""
+    if _active is not None:
+        _active.merge(data)
+
+
+@contextlib.contextmanager
+def run_report(name, path, profile_stage=None, profile_prefix=None):
+    """
+    Collect a report for the enclosed run and write it to `path` as JSON, also when the run fails.
+    `profile_stage` names a stage to profile with cProfile.
+    """
+    report = start(name, profile_stage, profile_prefix)
+    status = 'failed'
+    try:
+        yield report
+        status = 'ok'
+    finally:
+        stop()
+        try:
+            report.write(path, status=status)
+        except OSError as e:
+            print(f'Could not write the run report {path}: {e}')
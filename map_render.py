@@ -0,0 +1,144 @@
+import os
+import shlex
+import hashlib
+import subprocess
+import threading
+import concurrent.futures
+import numpy as np
+from ship_join import load_xyz
+
+# Rendered maps are kept in this folder inside each SID folder, one PNG per input hash
+MAP_CACHE_DIR = '.map_cache'
+
+
+def map_region(longitudes, latitudes):
+    """Map bounds (minlon, maxlon, minlat, maxlat) of a track"""
+    # Convert longitude and latitude to NumPy arrays
+    longitudes = np.array(longitudes)
+    latitudes = np.array(latitudes)
+
+    # Check if the longitudes cross the 180/-180 boundary
+    crosses_dateline = (longitudes.max() > 179) and (longitudes.min() < -179)
+
+    # Adjust longitudes crossing the boundary by adding 360 to negative values
+    if crosses_dateline:
+        longitudes[longitudes < 0] += 360
+
+    # Calculate min and max longitude and latitude
+    return longitudes.min(), longitudes.max(), latitudes.min(), latitudes.max()
+
+
+def _file_fingerprint(file_path):
+    stat = os.stat(file_path)
+    return f'{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def map_cache_key(sub_folder_path, crossover_file, region, cpt_path, folder_name):
+    """Hash of everything the rendered map depends on"""
+    digest = hashlib.sha256()
+    digest.update(_file_fingerprint(os.path.join(sub_folder_path, 'bathy.xyz')).encode())
+    digest.update(_file_fingerprint(crossover_file).encode())
+    with open(cpt_path, 'rb') as cpt_file:
+        digest.update(cpt_file.read())
+    digest.update(repr([float(v) for v in region]).encode())
+    digest.update(folder_name.encode())
+    return digest.hexdigest()[:32]
+
+
+def render_map(sub_folder_path, folder_name, crossover_file, cpt_path, longitudes=None, latitudes=None):
+    """
+    Render the ECOE map of a SID folder with GMT, or reuse the cached rendering of the same inputs.
+    The track coordinates are read from bathy.xyz when not given. Returns the path of the PNG.
+    """
+    if longitudes is None or latitudes is None:
+        ship = load_xyz(os.path.join(sub_folder_path, 'bathy.xyz'))
+        longitudes, latitudes = ship[:, 0], ship[:, 1]
+    region = map_region(longitudes, latitudes)
+    key = map_cache_key(sub_folder_path, crossover_file, region, cpt_path, folder_name)
+
+    cache_dir = os.path.join(sub_folder_path, MAP_CACHE_DIR)
+    output_image = os.path.join(cache_dir, f'{key}.png')
+    if os.path.exists(output_image):
+        return output_image
+    os.makedirs(cache_dir, exist_ok=True)
+
+    minlon, maxlon, minlat, maxlat = region
+    # GMT command string
+    command = f"""
+    gmt begin {MAP_CACHE_DIR}/{key} png I+m0.2c
+    gmt set FONT_TITLE 10p,1,black
+    gmt set MAP_TITLE_OFFSET -5p
+    gmt coast -R{minlon - 5}/{maxlon + 5}/{minlat - 5}/{maxlat + 5} -JQ15c -Baf -Df -BWSen+t"{folder_name} ECOEs" -A5000 -Ggray
+    gmt plot bathy.xyz -R{minlon - 5}/{maxlon + 5}/{minlat - 5}/{maxlat + 5} -JQ15c -Sc0.01 -Gblue
+    gmt plot {shlex.quote(os.path.abspath(crossover_file))} -R{minlon - 5}/{maxlon + 5}/{minlat - 5}/{maxlat + 5} -JQ15c -St0.1 -C{shlex.quote(cpt_path)}
+    gmt colorbar -DjBC+w5c/0.2c+o0c/-0.8c+m+h+e -S -Bxa1000f500 -G0/5000 -C{shlex.quote(cpt_path)}
+    gmt end
+    """
+
+    # Execute GMT command inside the subfolder without changing the working directory of the tool
+    subprocess.run(command, shell=True, cwd=sub_folder_path)
+    if not os.path.exists(output_image):
+        raise RuntimeError(f"GMT did not produce a map for {folder_name}")
+    return output_image
+
+
+class MapRenderer:
+    """
+    Renders ECOE maps on background threads, never on the caller's thread.
+    Maps the user asks for have their own worker so they never wait behind pre-rendering.
+    """
+
+    def __init__(self, cpt_path, workers=2):
+        self.cpt_path = os.path.abspath(cpt_path)
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.background_executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def _render(self, executor, sub_folder_path, folder_name, crossover_file, longitudes, latitudes):
+        try:
+            return render_map(sub_folder_path, folder_name, crossover_file, self.cpt_path, longitudes, latitudes)
+        except (OSError, RuntimeError, ValueError) as e:
+            print(f'Failed to render the map of {folder_name}: {e}')
+            return None
+        finally:
+            with self.lock:
+                # The folder may have been resubmitted to the other executor in the meantime
+                if self.pending.get(sub_folder_path, (None, None))[1] is executor:
+                    del self.pending[sub_folder_path]
+
+    def _submit(self, executor, sub_folder_path, folder_name, crossover_file, longitudes, latitudes):
+        future = executor.submit(self._render, executor, sub_folder_path, folder_name, crossover_file,
+                                 longitudes, latitudes)
+        self.pending[sub_folder_path] = future, executor
+        return future
+
+    def request(self, sub_folder_path, folder_name, crossover_file, callback=None, longitudes=None, latitudes=None,
+                background=False):
+        """
+        Render a map in the background, sharing the job when the folder is already being rendered.
+        A map the user asks for that is still queued for pre-rendering moves to the interactive worker.
+        `callback(folder_name, image_path)` is called from the worker thread; image_path is None on failure.
+        """
+        with self.lock:
+            future, executor = self.pending.get(sub_folder_path, (None, None))
+            if future is None:
+                future = self._submit(self.background_executor if background else self.executor,
+                                      sub_folder_path, folder_name, crossover_file, longitudes, latitudes)
+            elif not background and executor is self.background_executor and future.cancel():
+                future = self._submit(self.executor, sub_folder_path, folder_name, crossover_file,
+                                      longitudes, latitudes)
+        if callback:
+            future.add_done_callback(lambda f: callback(folder_name, None if f.cancelled() else f.result()))
+
+    def prerender(self, statistics_folder_path, folder_names):
+        """Queue the maps of every folder that has a crossover file"""
+        for folder_name in folder_names:
+            sub_folder_path = os.path.join(statistics_folder_path, folder_name)
+            crossover_file = os.path.join(sub_folder_path, 'crossover.txt')
+            if os.path.exists(crossover_file):
+                self.request(sub_folder_path, folder_name, crossover_file, background=True)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.background_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,133 @@
+import numpy as np
+from xyz_io import iter_text_chunks
+
+# Header names of the MGD77T columns read by this module
+COLUMNS = {
+    'lon': 'LON',
+    'lat': 'LAT',
+    'depth': 'CORR_DEPTH',
+    'timezone': 'TIMEZONE',
+    'date': 'DATE',
+    'time': 'TIME',
+    'nav_quality': 'NAV_QUALCO',
+    'bathy_quality': 'BAT_QUALCO',
+}
+
+# Geophysical observations; like `gmt mgd77list`, records where all requested ones are missing are skipped
+GEOPHYSICAL = ('depth',)
+
+# Fields derived from several columns
+DERIVED = {
+    'time': ('timezone', 'date', 'time'),
+}
+
+
+def column_indices(header_line):
+    """Map the MGD77T header names to their column positions"""
+    names = [name.strip().upper() for name in header_line.rstrip('\r\n').split('\t')]
+    return {name: i for i, name in enumerate(names)}
+
+
+def field_strings(data, starts, ends):
+    """Fixed-width byte strings of the fields data[start:end], stripped of surrounding whitespace"""
+    width = int((ends - starts).max()) if len(starts) else 0
+    if width == 0:
+        return np.zeros(len(starts), dtype='S1')
+    index = starts[:, None] + np.arange(width)
+    # Bytes past the end of a field become NUL padding, which fixed-width byte strings ignore
+    fields = np.where(index < ends[:, None], data[np.minimum(index, len(data) - 1)], 0).astype(np.uint8)
+    return np.char.strip(fields.view(f'S{width}').ravel())
+
+
+def parse_fields(text, positions):
+    """
+    Convert the fields at the given tab-separated column positions of a chunk of MGD77T records to floats
+    in one step per column. Returns one array per position with a value for every non-blank record; empty
+    fields, and fields missing from short records, become NaN.
+    """
+    if not text.endswith('\n'):
+        text += '\n'
+    data = np.frombuffer(text.encode(), dtype=np.uint8)
+    newline = data == ord('\n')
+    line_starts = np.concatenate(([0], np.flatnonzero(newline)[:-1] + 1))
+    # Records with nothing but whitespace are skipped
+    non_blank = np.logical_or.reduceat(data > ord(' '), line_starts)
+
+    # Every field ends at a tab or at the end of its line; its column is its position within the line
+    delimiters = np.flatnonzero(newline | (data == ord('\t')))
+    ends_line = newline[delimiters]
+    line = np.cumsum(ends_line) - ends_line
+    first_field = np.flatnonzero(np.concatenate(([True], ends_line[:-1])))
+    column = np.arange(len(delimiters)) - first_field[line]
+    starts = np.concatenate(([0], delimiters[:-1] + 1))
+
+    columns = []
+    for position in positions:
+        selected = np.flatnonzero(column == position)
+        strings = field_strings(data, starts[selected], delimiters[selected])
+        values = np.full(len(line_starts), np.nan)
+        values[line[selected]] = np.where(strings == b'', b'nan', strings).astype(np.float64)
+        columns.append(values[non_blank])
+    return columns
+
+
+def gmt_seconds(timezone, date, time):
+    """
+    Seconds since 1970-01-01 GMT from the MGD77T DATE (yyyymmdd), TIME (hhmm.xxx) and
+    TIMEZONE (hours added to local time to obtain GMT) columns. Missing dates give NaN.
+    """
+    valid = ~np.isnan(date)
+    day = np.full(len(date), np.nan)
+    if valid.any():
+        dates = date[valid].astype(np.int64)
+        text = [f'{d // 10000:04d}-{d // 100 % 100:02d}-{d % 100:02d}' for d in dates.tolist()]
+        day[valid] = np.array(text, dtype='datetime64[D]').astype(np.int64) * 86400.0
+    time = np.nan_to_num(time)
+    hours = np.floor(time / 100)
+    minutes = time - hours * 100
+    return day + (hours + np.nan_to_num(timezone)) * 3600 + minutes * 60
+
+
+def iter_mgd77t(file_path, fields=('lon', 'lat', 'depth'), chunk_size=500000):
+    """
+    Read a tab-delimited MGD77T file in chunks of records.
+    Yields a dict of NumPy arrays per chunk, one per requested field: lon, lat, depth (corrected
+    depth in metres, positive down), time (seconds since 1970 GMT), nav_quality and bathy_quality.
+    As with `gmt mgd77list`, records whose requested geophysical fields (see GEOPHYSICAL) are all
+    empty are left out.
+    """
+    with open(file_path, 'r') as m77_file:
+        indices = column_indices(m77_file.readline())
+        needed = []
+        for field in fields:
+            for column in DERIVED.get(field, (field,)):
+                if column not in needed:
+                    needed.append(column)
+        missing = [COLUMNS[column] for column in needed if COLUMNS[column] not in indices]
+        if missing:
+            raise ValueError(f"{file_path} has no column(s) {', '.join(missing)}")
+        positions = [indices[COLUMNS[column]] for column in needed]
+
+        for text in iter_text_chunks(m77_file, chunk_size * 128):
+            columns = dict(zip(needed, parse_fields(text, positions)))
+
+            observed = [columns[field] for field in fields if field in GEOPHYSICAL]
+            keep = np.logical_or.reduce([~np.isnan(values) for values in observed]) if observed else None
+
+            chunk = {}
+            for field in fields:
+                if field in DERIVED:
+                    chunk[field] = gmt_seconds(*(columns[column] for column in DERIVED[field]))
+                else:
+                    chunk[field] = columns[field]
+                if keep is not None:
+                    chunk[field] = chunk[field][keep]
+            yield chunk
+
+
+def read_mgd77t(file_path, fields=('lon', 'lat', 'depth')):
+    """Read whole columns of a MGD77T file as a dict of NumPy arrays"""
+    chunks = list(iter_mgd77t(file_path, fields))
+    if not chunks:
+        return {field: np.empty(0) for field in fields}
+    return {field: np.concatenate([chunk[field] for chunk in chunks]) for field in fields}
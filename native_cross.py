@@ -0,0 +1,230 @@
+import os
+import sys
+import glob
+import shutil
+import subprocess
+import tempfile
+import numpy as np
+from xyz_cache import parse_columns
+from xyz_io import read_x2sys, write_x2sys
+
+# Segments covering more grid cells than this (e.g. long data gaps) are tested by bounding box instead
+LONG_SEGMENT_CELLS = 64
+
+
+def valid_track(track):
+    """Drop points without a usable depth (NaN or zero) and bring longitudes into 0-360"""
+    track = track[~np.isnan(track[:, 2]) & (track[:, 2] != 0)].copy()
+    track[:, 0] %= 360
+    return track
+
+
+def track_segments(track):
+    """
+    Segments between consecutive points of a track, with the end longitude unwrapped to within 180 degrees
+    of the start. Segments crossing the 0/360 seam are added a second time shifted by 360 degrees, so
+    crossovers on either side of the seam are found; find_crossovers keeps those inside [0, 360).
+    Returns the segment starts and ends and the index of the segment along the track.
+    """
+    start = track[:-1]
+    end = track[1:].copy()
+    # Only longitudes that jump across the seam are changed, so the others keep their exact values
+    jump = np.abs(end[:, 0] - start[:, 0]) > 180
+    end[jump, 0] = start[jump, 0] + (end[jump, 0] - start[jump, 0] + 180) % 360 - 180
+    index = np.arange(len(start))
+
+    seam = np.flatnonzero((end[:, 0] < 0) | (end[:, 0] >= 360))
+    shift = np.zeros((len(seam), 3))
+    shift[:, 0] = np.where(end[seam, 0] < 0, 360, -360)
+    return (np.concatenate((start, start[seam] + shift)), np.concatenate((end, end[seam] + shift)),
+            np.concatenate((index, index[seam])))
+
+
+def cell_ranges(start, end, cell_size):
+    """Range of grid cells covered by the bounding box of each segment"""
+    ix0 = np.floor(np.minimum(start[:, 0], end[:, 0]) / cell_size).astype(np.int64)
+    ix1 = np.floor(np.maximum(start[:, 0], end[:, 0]) / cell_size).astype(np.int64)
+    iy0 = np.floor(np.minimum(start[:, 1], end[:, 1]) / cell_size).astype(np.int64)
+    iy1 = np.floor(np.maximum(start[:, 1], end[:, 1]) / cell_size).astype(np.int64)
+    return ix0, ix1, iy0, iy1
+
+
+def segment_cells(segments, ix0, ix1, iy0, iy1):
+    """Expand segments into (segment, grid cell key) pairs for every cell their bounding box covers"""
+    ny = iy1 - iy0 + 1
+    counts = (ix1 - ix0 + 1) * ny
+
+    segment = np.repeat(segments, counts)
+    # Position of each expanded entry inside its segment's block of cells
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    ix = np.repeat(ix0, counts) + offset // np.repeat(ny, counts)
+    iy = np.repeat(iy0, counts) + offset % np.repeat(ny, counts)
+    # Pack both indices into one int64 key; a collision would only add candidates, never lose one
+    return segment, (ix << 20) + (iy + (1 << 19))
+
+
+def bbox_pairs(segments1, start1, end1, start2, end2):
+    """Pairs of a few segments of track 1 with every segment of track 2 whose bounding boxes overlap"""
+    min2 = np.minimum(start2[:, :2], end2[:, :2])
+    max2 = np.maximum(start2[:, :2], end2[:, :2])
+    first, second = [], []
+    for segment in segments1:
+        min1 = np.minimum(start1[segment, :2], end1[segment, :2])
+        max1 = np.maximum(start1[segment, :2], end1[segment, :2])
+        overlap = np.flatnonzero(np.all((max2 >= min1) & (max1 >= min2), axis=1))
+        first.append(np.full(len(overlap), segment))
+        second.append(overlap)
+    if not first:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(first), np.concatenate(second)
+
+
+def candidate_pairs(start1, end1, start2, end2, cell_size):
+    """Segment pairs of two tracks whose bounding boxes share at least one grid cell"""
+    ranges1 = cell_ranges(start1, end1, cell_size)
+    ranges2 = cell_ranges(start2, end2, cell_size)
+    long1 = (ranges1[1] - ranges1[0] + 1) * (ranges1[3] - ranges1[2] + 1) > LONG_SEGMENT_CELLS
+    long2 = (ranges2[1] - ranges2[0] + 1) * (ranges2[3] - ranges2[2] + 1) > LONG_SEGMENT_CELLS
+    short1 = np.flatnonzero(~long1)
+    short2 = np.flatnonzero(~long2)
+
+    segment1, key1 = segment_cells(short1, *(r[short1] for r in ranges1))
+    segment2, key2 = segment_cells(short2, *(r[short2] for r in ranges2))
+
+    order = np.argsort(key2, kind='stable')
+    key2 = key2[order]
+    segment2 = segment2[order]
+    lower = np.searchsorted(key2, key1, side='left')
+    upper = np.searchsorted(key2, key1, side='right')
+    counts = upper - lower
+
+    first = np.repeat(segment1, counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    second = segment2[np.repeat(lower, counts) + offset]
+
+    # Long segments are compared with every segment of the other track by bounding box
+    long_first, long_second = bbox_pairs(np.flatnonzero(long1), start1, end1, start2, end2)
+    reverse_second, reverse_first = bbox_pairs(np.flatnonzero(long2), start2, end2, start1, end1)
+    first = np.concatenate((first, long_first, reverse_first))
+    second = np.concatenate((second, long_second, reverse_second))
+
+    # Segments sharing several cells are paired once
+    pairs = np.unique(first.astype(np.int64) * len(start2) + second)
+    return pairs // len(start2), pairs % len(start2)
+
+
+def find_crossovers(track1, track2, cell_size=None):
+    """
+    External crossovers between two tracks of (lon, lat, depth) rows.
+    Depths are interpolated linearly along each track at the intersection.
+    Returns an array of (lon, lat, z_X, z_M) rows with z_X = z1 - z2 and z_M the mean depth,
+    matching the last two columns of `gmt x2sys_cross -TXYZ`.
+    """
+    track1 = valid_track(track1)
+    track2 = valid_track(track2)
+    empty = np.empty((0, 4))
+    if len(track1) < 2 or len(track2) < 2:
+        return empty
+
+    start1, end1, index1 = track_segments(track1)
+    start2, end2, index2 = track_segments(track2)
+    if len(start1) == 0 or len(start2) == 0:
+        return empty
+
+    if cell_size is None:
+        # Cells about as large as a typical segment keep the number of cell entries per segment small
+        lengths = np.hypot(*(np.concatenate((end1 - start1, end2 - start2))[:, :2].T))
+        cell_size = max(float(np.median(lengths)) * 4, 1e-4)
+
+    first, second = candidate_pairs(start1, end1, start2, end2, cell_size)
+    p, r = start1[first], end1[first] - start1[first]
+    q, s = start2[second], end2[second] - start2[second]
+
+    # Solve p + t*r = q + u*s for both segment parameters
+    denominator = r[:, 0] * s[:, 1] - r[:, 1] * s[:, 0]
+    qp = q[:, :2] - p[:, :2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (qp[:, 0] * s[:, 1] - qp[:, 1] * s[:, 0]) / denominator
+        u = (qp[:, 0] * r[:, 1] - qp[:, 1] * r[:, 0]) / denominator
+        lon = p[:, 0] + t * r[:, 0]
+    # Half-open parameter ranges so a crossing exactly at a shared vertex is counted once; a crossing near the
+    # seam is found in both frames of the segments crossing it and only kept in the one where it is in [0, 360)
+    hit = (denominator != 0) & (t >= 0) & (t < 1) & (u >= 0) & (u < 1) & (lon >= 0) & (lon < 360)
+
+    t, u, lon = t[hit], u[hit], lon[hit]
+    p, r, q, s = p[hit], r[hit], q[hit], s[hit]
+    lat = p[:, 1] + t * r[:, 1]
+    z1 = p[:, 2] + t * r[:, 2]
+    z2 = q[:, 2] + u * s[:, 2]
+
+    # Report crossovers in along-track order of the first track
+    order = np.lexsort((t, index1[first[hit]]))
+    lon = np.where(lon > 180, lon - 360, lon)
+    rows = np.column_stack((lon, lat, z1 - z2, (z1 + z2) / 2))
+    return rows[order]
+
+
+def write_crossovers(output_file, rows, file1, file2):
+    """Write crossover rows after a 4-line header, in the layout read back from `x2sys_cross` output"""
+    write_x2sys(output_file, rows, ("# Tools: native_cross", f"# Files: {file1} {file2}",
+                                    "# Depth interpolated linearly along each track", "# lon lat z_X z_M"))
+
+
+def cross_files(folder, filtered_file, bathy_files):
+    """Run the native engine for each copied track of a folder and write the per-pair crossover files"""
+    track1 = parse_columns(os.path.join(folder, filtered_file), 3)
+    for filename in bathy_files:
+        output_file = os.path.join(folder, f"{os.path.splitext(filename)[0]}_crossover.txt")
+        rows = find_crossovers(track1, parse_columns(os.path.join(folder, filename), 3))
+        write_crossovers(output_file, rows, filtered_file, filename)
+
+
+def verify_against_gmt(folder, position_tolerance=1e-3, coe_tolerance=1.0):
+    """
+    Compare the native engine with `gmt x2sys_cross` for every bathy_*.xyz in a prepared folder.
+    Crossovers are matched by position; returns one summary dict per track pair.
+    """
+    if shutil.which("gmt") is None:
+        raise RuntimeError("GMT is not installed, nothing to verify against")
+
+    track1 = parse_columns(os.path.join(folder, "filtered.xyz"), 3)
+    bathy_files = sorted(os.path.basename(f) for f in glob.glob(os.path.join(glob.escape(folder), "bathy_*.xyz")))
+    summaries = []
+    for filename in bathy_files:
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as gmt_file:
+            subprocess.run(["gmt", "x2sys_cross", "filtered.xyz", filename, "-Qe", "-W2", "-TXYZ"],
+                           stdout=gmt_file, cwd=folder)
+        gmt_rows = read_x2sys(gmt_file.name)
+        os.remove(gmt_file.name)
+        native_rows = find_crossovers(track1, parse_columns(os.path.join(folder, filename), 3))
+
+        matched = 0
+        coe_differences = []
+        for lon, lat, z_x, _ in gmt_rows:
+            if len(native_rows) == 0:
+                break
+            distance = np.hypot((native_rows[:, 0] - lon + 180) % 360 - 180, native_rows[:, 1] - lat)
+            nearest = np.argmin(distance)
+            if distance[nearest] <= position_tolerance:
+                matched += 1
+                coe_differences.append(abs(native_rows[nearest, 2] - z_x))
+
+        max_difference = max(coe_differences) if coe_differences else 0.0
+        summaries.append({
+            'file': filename,
+            'gmt': len(gmt_rows),
+            'native': len(native_rows),
+            'matched': matched,
+            'max_coe_difference': max_difference,
+            'agree': matched == len(gmt_rows) == len(native_rows) and max_difference <= coe_tolerance,
+        })
+    return summaries
+
+
+if __name__ == "__main__":
+    # Usage: python native_cross.py <folder prepared by the crossover stage>
+    results = verify_against_gmt(sys.argv[1])
+    for result in results:
+        print(f"{result['file']}: gmt={result['gmt']} native={result['native']} matched={result['matched']} "
+              f"max |dCOE|={result['max_coe_difference']:.1f} {'OK' if result['agree'] else 'MISMATCH'}")
+    sys.exit(0 if all(result['agree'] for result in results) else 1)
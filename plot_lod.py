@@ -0,0 +1,51 @@
+import numpy as np
+
+
+def minmax_decimate(values, start=0, stop=None, bins=1000):
+    """
+    M4-style decimation of an along-track series for line plots.
+    The range [start, stop) is split into about `bins` bins and only the first, minimum, maximum and last
+    point of each bin are kept, which draws the same line at screen resolution.
+    Returns the kept point indices and their values.
+    """
+    stop = len(values) if stop is None else min(int(stop), len(values))
+    start = min(max(int(start), 0), stop)
+    n = stop - start
+    if n <= 4 * bins:
+        index = np.arange(start, stop)
+        return index, np.asarray(values[start:stop])
+
+    size = -(-n // bins)
+    rows = -(-n // size)
+    padded = np.full(rows * size, np.nan)
+    padded[:n] = values[start:stop]
+    block = padded.reshape(rows, size)
+
+    base = np.arange(rows) * size
+    finite = ~np.isnan(block)
+    low = base + np.where(finite, block, np.inf).argmin(axis=1)
+    high = base + np.where(finite, block, -np.inf).argmax(axis=1)
+    last = np.minimum(base + size - 1, n - 1)
+    index = np.sort(np.column_stack((base, low, high, last)), axis=1).ravel()
+    index = start + np.minimum(index, n - 1)
+    return index, np.asarray(values)[index]
+
+
+def density_grid(x, y, bins=300, x_range=None, y_range=None):
+    """
+    Bin a large scatter into a 2-D point count grid.
+    Returns the counts (indexed [y, x] for image display) and the extent (xmin, xmax, ymin, ymax).
+    """
+    finite = np.isfinite(x) & np.isfinite(y)
+    x, y = x[finite], y[finite]
+    if x_range is None:
+        x_range = (x.min(), x.max()) if len(x) else (0, 1)
+    if y_range is None:
+        y_range = (y.min(), y.max()) if len(y) else (0, 1)
+    # A degenerate range would give zero-width bins
+    if x_range[0] == x_range[1]:
+        x_range = (x_range[0] - 0.5, x_range[1] + 0.5)
+    if y_range[0] == y_range[1]:
+        y_range = (y_range[0] - 0.5, y_range[1] + 0.5)
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins, range=[x_range, y_range])
+    return counts.T, (x_edges[0], x_edges[-1], y_edges[0], y_edges[-1])
@@ -0,0 +1,208 @@
+import os
+import shutil
+import subprocess
+import concurrent.futures
+import numpy as np
+from xyz_cache import update_cache, write_cache
+from xyz_io import format_rows, write_rows, select_rows, iter_line_chunks
+from track import Track
+from mgd77t import iter_mgd77t
+from grid_sampler import open_grid, unpack_grid
+import instrumentation
+from instrumentation import stage, count
+
+# Files written for every SID folder by the preprocessing stage
+OUTPUT_FILES = ("bathy.xyz", "lon_lat.txt", "topo.xyz")
+
+
+def list_m77_files(folder_path):
+    """Find all .m77t files that don't start with a dot"""
+    return [f for f in os.listdir(folder_path) if f.endswith(".m77t") and not f.startswith(".")]
+
+
+def is_up_to_date(sub_folder_path, source_paths):
+    """Check that every output of a SID folder exists and is newer than all of its sources"""
+    newest_source = max(os.path.getmtime(path) for path in source_paths)
+    for name in OUTPUT_FILES:
+        path = os.path.join(sub_folder_path, name)
+        if not os.path.exists(path) or os.path.getmtime(path) < newest_source:
+            return False
+    return True
+
+
+def read_points(m77_file_path, reader="native", chunk_size=500000):
+    """
+    Yield chunks of (lon, lat, depth) arrays from a .m77t file, depth positive down.
+    The native reader parses the file directly; "gmt" streams the output of `gmt mgd77list`.
+    """
+    if reader == "native":
+        for chunk in iter_mgd77t(m77_file_path, ("lon", "lat", "depth"), chunk_size):
+            yield chunk["lon"], chunk["lat"], chunk["depth"]
+        return
+    if reader != "gmt":
+        raise ValueError(f"Unknown .m77t reader: {reader}")
+
+    # Run the GMT command to extract data from the .m77t file
+    mgd77_command = ["gmt", "mgd77list", m77_file_path, "-Flon,lat,depth"]
+    mgd77 = subprocess.Popen(mgd77_command, stdout=subprocess.PIPE, text=True)
+    # Only lines with the expected number of columns are points
+    for lines in iter_line_chunks(mgd77.stdout, chunk_size * 64):
+        points = select_rows(lines, 3)
+        if len(points):
+            yield tuple(points.T)
+    mgd77.wait()
+
+
+def resolve_sampler(grd_file_path, sampler="auto"):
+    """
+    Model sampler to use: "native" for the in-process bilinear sampler, "gmt" for `gmt grdtrack`,
+    or "auto" for the native sampler whenever the model file can be read in Python and unpacked into a
+    writable cache. Unpacking the grid here lets the worker processes share its memory-mapped cache.
+    """
+    if sampler not in ("auto", "native", "gmt"):
+        raise ValueError(f"Unknown model sampler: {sampler}")
+    if sampler == "gmt":
+        return sampler
+    try:
+        unpack_grid(grd_file_path)
+    except Exception:
+        if sampler == "native":
+            raise
+        return "gmt"
+    return "native"
+
+
+def preprocess_file(m77_file_path, output_folder_path, grd_file_path, force=False, reader="native",
+                    sampler="native"):
+    """
+    Preprocess one .m77t file into its SID folder in a single pass over its records.
+    Returns (SID, True) when the file was processed and (SID, False) when its outputs were up to date.
+    """
+    m77_file = os.path.basename(m77_file_path)
+    sub_folder_name = os.path.splitext(m77_file)[0]
+    sub_folder_path = os.path.join(output_folder_path, sub_folder_name)
+    if not force and os.path.isdir(sub_folder_path) and is_up_to_date(sub_folder_path, (m77_file_path, grd_file_path)):
+        count('files_up_to_date')
+        return sub_folder_name, False
+    os.makedirs(sub_folder_path, exist_ok=True)  # Create the subfolder if it doesn't exist
+
+    # Copy the original .m77t file to the subfolder
+    with stage('preprocess.copy'):
+        shutil.copy(m77_file_path, os.path.join(sub_folder_path, m77_file))
+
+    bathy_file_path = os.path.join(sub_folder_path, "bathy.xyz")
+    lon_lat_file_path = os.path.join(sub_folder_path, "lon_lat.txt")
+    topo_file_path = os.path.join(sub_folder_path, "topo.xyz")
+
+    # Outputs are written under temporary names and renamed once complete, so an interrupted run never leaves
+    # truncated files that is_up_to_date would take for finished ones
+    output_paths = (bathy_file_path, lon_lat_file_path, topo_file_path)
+    temporary_paths = [f"{path}.{os.getpid()}.tmp" for path in output_paths]
+    try:
+        bathy_chunks, lon_lat_chunks, topo_chunks = write_outputs(m77_file_path, grd_file_path, *temporary_paths,
+                                                                  reader, sampler)
+    except BaseException:
+        for path in temporary_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    for temporary_path, path in zip(temporary_paths, output_paths):
+        os.replace(temporary_path, path)
+
+    # Write the binary caches used by the crossover, statistics and correction stages straight from the arrays
+    with stage('preprocess.cache'):
+        write_cache(bathy_file_path, np.concatenate(bathy_chunks) if bathy_chunks else np.empty((0, 3)))
+        write_cache(lon_lat_file_path, np.concatenate(lon_lat_chunks) if lon_lat_chunks else np.empty((0, 2)))
+        if sampler == "gmt":
+            update_cache(topo_file_path, 3)
+        else:
+            write_cache(topo_file_path, np.concatenate(topo_chunks) if topo_chunks else np.empty((0, 3)))
+    count('files_processed')
+    return sub_folder_name, True
+
+
+def write_outputs(m77_file_path, grd_file_path, bathy_file_path, lon_lat_file_path, topo_file_path, reader,
+                  sampler):
+    """
+    Write bathy.xyz, lon_lat.txt and topo.xyz of a .m77t file to the given paths in a single pass over its
+    records. Returns the chunks of bathy, lon/lat and (native sampler only) topo rows written.
+    """
+    bathy_chunks = []
+    lon_lat_chunks = []
+    topo_chunks = []
+    with open(bathy_file_path, "w") as bathy_file, open(lon_lat_file_path, "w") as lon_lat_file, \
+            open(topo_file_path, "w") as topo_file:
+        if sampler == "gmt":
+            # grdtrack samples the model from the lon/lat points streamed to it while they are written
+            grdtrack_command = ["gmt", "grdtrack", f"-G{grd_file_path}"]
+            grdtrack = subprocess.Popen(grdtrack_command, stdin=subprocess.PIPE, stdout=topo_file, text=True)
+        else:
+            grid = open_grid(grd_file_path)
+
+        points = read_points(m77_file_path, reader)
+        while True:
+            with stage('preprocess.read'):
+                chunk = next(points, None)
+            if chunk is None:
+                break
+            lon, lat, depth = chunk
+            track = Track(lon, lat, -depth)  # Write data with depth as a negative value
+
+            # Ensure depth is not zero or NaN
+            valid = track[track.valid()]
+            count('points_read', len(track))
+            count('points_valid', len(valid))
+
+            bathy = track.columns('lon', 'lat', 'depth')
+            lon_lat = valid.columns('lon', 'lat')
+            with stage('preprocess.write'):
+                write_rows(bathy_file, bathy)
+                lon_lat_text = format_rows(lon_lat)
+                lon_lat_file.write(lon_lat_text)
+
+            with stage('preprocess.sample'):
+                if sampler == "gmt":
+                    grdtrack.stdin.write(lon_lat_text)
+                else:
+                    # Points outside the model or on missing nodes are left out of topo.xyz
+                    valid.topo = grid.sample(valid.lon, valid.lat)
+                    sampled = valid[~np.isnan(valid.topo)]
+                    sampled.write_to(topo_file, ('lon', 'lat', 'topo'))
+                    topo_chunks.append(sampled.columns('lon', 'lat', 'topo'))
+                    count('points_sampled', len(sampled))
+
+            bathy_chunks.append(bathy)
+            lon_lat_chunks.append(lon_lat)
+
+        if sampler == "gmt":
+            with stage('preprocess.sample'):
+                grdtrack.stdin.close()
+                grdtrack.wait()
+    return bathy_chunks, lon_lat_chunks, topo_chunks
+
+
+def preprocess_folder(folder_path, output_folder_path, grd_file_path, workers=None, progress=None, force=False,
+                      reader="native", sampler="auto"):
+    """
+    Preprocess all .m77t files of a folder across a pool of worker processes.
+    `workers` is the pool size (all cores when None); `progress(done, total, SID, processed)` is called
+    as each file finishes. SIDs whose outputs are newer than the .m77t and model files are skipped
+    unless `force` is set. `reader` selects the built-in MGD77T reader or `gmt mgd77list`, and
+    `sampler` the in-process model sampler or `gmt grdtrack` (see resolve_sampler).
+    """
+    with stage('preprocess.unpack_grid'):
+        sampler = resolve_sampler(grd_file_path, sampler)
+    m77_files = list_m77_files(folder_path)
+    total = len(m77_files)
+    settings = instrumentation.worker_settings()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(instrumentation.call, settings, preprocess_file, os.path.join(folder_path, m77_file),
+                            output_folder_path, grd_file_path, force, reader, sampler)
+            for m77_file in m77_files
+        ]
+        for done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            (sub_folder_name, processed), worker_data = future.result()
+            instrumentation.merge(worker_data)
+            if progress:
+                progress(done, total, sub_folder_name, processed)
@@ -0,0 +1,53 @@
+import numpy as np
+from xyz_cache import load_columns
+
+
+def load_xyz(file_path, ncols=3):
+    """Load a whitespace-delimited xyz file as a 2-D float array, through the binary cache"""
+    return load_columns(file_path, ncols)
+
+
+def point_keys(x, y):
+    """Pack (x, y) pairs into complex keys so NumPy can sort and compare a coordinate in one step"""
+    keys = np.empty(len(x), dtype=np.complex128)
+    keys.real = x
+    keys.imag = y
+    return keys
+
+
+def index_points(x, y):
+    """Sort point keys once so that many lookups can be made against them"""
+    keys = point_keys(x, y)
+    order = np.argsort(keys, kind='stable')
+    return keys[order], order
+
+
+def lookup_points(ship_x, ship_y, sorted_keys, order):
+    """Return (ship_index, topo_index) of the ship points found in an index built by index_points"""
+    ship_keys = point_keys(ship_x, ship_y)
+    if len(ship_keys) == 0 or len(sorted_keys) == 0:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty
+
+    # side='right' selects the last duplicate, as a later entry would win in a dict
+    position = np.searchsorted(sorted_keys, ship_keys, side='right') - 1
+    position = np.clip(position, 0, None)
+    found = sorted_keys[position] == ship_keys
+
+    ship_index = np.flatnonzero(found)
+    topo_index = order[position[found]]
+    return ship_index, topo_index
+
+
+def match_points(ship_x, ship_y, topo_x, topo_y):
+    """
+    Find the ship points whose coordinates also appear in the topo file.
+    Returns index arrays (ship_index, topo_index) of the matching rows, in ship order.
+    """
+    # topo.xyz is sampled from lon_lat.txt, so both files usually follow the same point order
+    if len(ship_x) == len(topo_x) and np.array_equal(ship_x, topo_x) and np.array_equal(ship_y, topo_y):
+        index = np.arange(len(ship_x))
+        return index, index
+
+    # Sorted-key join
+    return lookup_points(ship_x, ship_y, *index_points(topo_x, topo_y))
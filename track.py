@@ -0,0 +1,133 @@
+import numpy as np
+from ship_join import load_xyz, match_points, index_points, lookup_points
+from xyz_io import write_xyz, write_rows
+
+# Class flags of a point, combined bitwise in Track.flags
+LAND = 1  # model above sea level
+MISFIT = 2  # ship - model difference above the misfit threshold
+OUTLIER = 4  # large error next to a crossover with a large COE
+TRAVEL_TIME = 8  # shifted by a travel-time step
+DELETED = 16  # left out of the corrected output
+
+
+class Track:
+    """
+    Points of one track-line as column arrays: lon and lat (float64), ship depth and model depth (topo, NaN until
+    joined), point IDs (the row of the point in bathy.xyz) and class flags (uint8, see LAND ... DELETED).
+    Columns that already have the right dtype are used as given, so a Track loaded from a binary cache
+    reads the memory map; topo, point IDs and flags are only allocated when first used.
+    Slicing returns a Track of views on the same arrays; boolean masks and index arrays select copies.
+    Depths are float64 by default so written outputs keep their exact text; `depth_dtype=np.float32`
+    halves their memory where that does not matter.
+    """
+    __slots__ = ('sid', 'lon', 'lat', 'depth', '_topo', '_point_id', '_flags')
+
+    def __init__(self, lon, lat, depth, topo=None, point_id=None, flags=None, sid=None, depth_dtype=np.float64):
+        self.sid = sid
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.depth = np.asarray(depth, dtype=depth_dtype)
+        self._topo = None if topo is None else np.asarray(topo, dtype=depth_dtype)
+        # None stands for the point IDs 0 .. n - 1 of a track that was never subset
+        self._point_id = point_id
+        self._flags = flags
+
+    @classmethod
+    def from_array(cls, data, sid=None, depth_dtype=np.float64):
+        """Track from an (n, 3) lon, lat, depth array; its columns are viewed, not copied, when they are float64"""
+        data = np.asarray(data)
+        return cls(data[:, 0], data[:, 1], data[:, 2], sid=sid, depth_dtype=depth_dtype)
+
+    @classmethod
+    def load(cls, file_path, sid=None, depth_dtype=np.float64):
+        """Track from an xyz file such as bathy.xyz, on the memory map of its binary cache"""
+        return cls.from_array(load_xyz(file_path), sid, depth_dtype)
+
+    @property
+    def topo(self):
+        if self._topo is None:
+            self._topo = np.full(len(self), np.nan, dtype=self.depth.dtype)
+        return self._topo
+
+    @topo.setter
+    def topo(self, topo):
+        self._topo = np.asarray(topo, dtype=self.depth.dtype)
+
+    @property
+    def point_id(self):
+        if self._point_id is None:
+            self._point_id = np.arange(len(self), dtype=np.int32 if len(self) < 2 ** 31 else np.int64)
+        return self._point_id
+
+    @property
+    def flags(self):
+        if self._flags is None:
+            self._flags = np.zeros(len(self), dtype=np.uint8)
+        return self._flags
+
+    def __len__(self):
+        return len(self.lon)
+
+    def __getitem__(self, key):
+        if self._point_id is None and isinstance(key, slice) and key == slice(None):
+            point_id = None
+        else:
+            point_id = self.point_id[key]
+        return Track(self.lon[key], self.lat[key], self.depth[key], None if self._topo is None else self._topo[key],
+                     point_id, None if self._flags is None else self._flags[key], self.sid, self.depth.dtype)
+
+    @property
+    def nbytes(self):
+        columns = (self.lon, self.lat, self.depth, self._topo, self._point_id, self._flags)
+        return sum(column.nbytes for column in columns if column is not None)
+
+    def valid(self):
+        """Mask of the points whose ship depth is neither NaN nor zero"""
+        return ~np.isnan(self.depth) & (self.depth != 0)
+
+    def clean(self):
+        """The points whose ship depth is neither NaN nor zero"""
+        return self[self.valid()]
+
+    def join(self, model):
+        """
+        The points that have a model point at identical coordinates, in this track's order, with topo set to the
+        model depth. The model is an (n, 3) lon, lat, depth array such as topo.xyz from load_xyz.
+        When every point matches, the columns are shared, not copied.
+        """
+        ship_index, model_index = match_points(self.lon, self.lat, model[:, 0], model[:, 1])
+        joined = self[:] if len(ship_index) == len(self) else self[ship_index]
+        joined.topo = model[model_index, 2]
+        return joined
+
+    def iter_joined_chunks(self, model, chunk_size=1000000):
+        """
+        Clean and join the points chunk by chunk against an index of the model (an (n, 3) array) built once.
+        Yields a joined Track per chunk, in this track's order.
+        """
+        sorted_keys, order = index_points(model[:, 0], model[:, 1])
+        for start in range(0, len(self), chunk_size):
+            chunk = self[start:start + chunk_size].clean()
+            ship_index, model_index = lookup_points(chunk.lon, chunk.lat, sorted_keys, order)
+            joined = chunk[ship_index]
+            joined.topo = model[model_index, 2]
+            yield joined
+
+    def has(self, flag):
+        """Mask of the points with a class flag set"""
+        return (self.flags & flag) != 0
+
+    def set_flag(self, flag, mask):
+        self.flags[mask] |= flag
+
+    def columns(self, *names):
+        """(n, k) array of the named columns, e.g. columns('lon', 'lat', 'depth')"""
+        return np.column_stack([getattr(self, name) for name in names])
+
+    def write(self, file_path, names=('lon', 'lat', 'depth'), line_format=None):
+        """Write the named columns as an xyz file (repr floats unless a line format is given)"""
+        write_xyz(file_path, self.columns(*names), line_format)
+
+    def write_to(self, text_file, names=('lon', 'lat', 'depth'), line_format=None):
+        """Write the named columns to an open text file"""
+        write_rows(text_file, self.columns(*names), line_format)
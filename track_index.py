@@ -0,0 +1,162 @@
+import os
+import json
+import math
+import numpy as np
+from xyz_cache import load_columns, source_signature
+
+# Bounding boxes of folder B are kept in this file so later runs only re-read changed tracks
+INDEX_FILE_NAME = '.track_index.json'
+
+
+def read_coordinates(file_path):
+    coordinates = np.array(load_columns(file_path, 2))
+    coordinates[coordinates[:, 0] < 0, 0] += 360
+    return coordinates
+
+
+def get_bounding_box(coordinates):
+    min_lon, min_lat = coordinates.min(axis=0)
+    max_lon, max_lat = coordinates.max(axis=0)
+    return min_lon, max_lon, min_lat, max_lat
+
+
+def check_overlap(bbox1, bbox2):
+    min_lon1, max_lon1, min_lat1, max_lat1 = bbox1
+    min_lon2, max_lon2, min_lat2, max_lat2 = bbox2
+
+    overlap_lon = max_lon1 >= min_lon2 and max_lon2 >= min_lon1
+    overlap_lat = max_lat1 >= min_lat2 and max_lat2 >= min_lat1
+
+    return overlap_lon and overlap_lat
+
+
+def segment_boxes(coordinates, segment_length=1.0):
+    """
+    Tight bounding boxes of consecutive along-track segments, about `segment_length` degrees long each.
+    Longitudes are unwrapped along the track, so segments crossing 0 or 180 degrees keep small boxes.
+    Each box (min_lon, max_lon, min_lat, max_lat) has min_lon in [0, 360) and max_lon up to min_lon + 360,
+    and also covers the line to the first point of the next segment.
+    """
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    if len(coordinates) == 0:
+        return np.empty((0, 4))
+    lon = np.unwrap(coordinates[:, 0] % 360, period=360)
+    lat = coordinates[:, 1]
+
+    # Segments are cut by along-track distance, measured as the larger of the lon/lat steps
+    step = np.maximum(np.abs(np.diff(lon)), np.abs(np.diff(lat)))
+    segment = np.floor(np.concatenate(([0.0], np.cumsum(step))) / segment_length)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(segment)) + 1))
+
+    boxes = np.column_stack((np.minimum.reduceat(lon, starts), np.maximum.reduceat(lon, starts),
+                             np.minimum.reduceat(lat, starts), np.maximum.reduceat(lat, starts)))
+    # Extend each segment to the first point of the next one so the connecting line is covered
+    following = starts[1:]
+    boxes[:-1, 0] = np.minimum(boxes[:-1, 0], lon[following])
+    boxes[:-1, 1] = np.maximum(boxes[:-1, 1], lon[following])
+    boxes[:-1, 2] = np.minimum(boxes[:-1, 2], lat[following])
+    boxes[:-1, 3] = np.maximum(boxes[:-1, 3], lat[following])
+
+    shift = np.floor(boxes[:, 0] / 360) * 360
+    boxes[:, 0] -= shift
+    boxes[:, 1] -= shift
+    return boxes
+
+
+def boxes_overlap(boxes, bbox):
+    """Mask of the boxes overlapping one box, with longitudes compared modulo 360"""
+    min_lon, max_lon, min_lat, max_lat = bbox
+    overlap_lat = (boxes[:, 3] >= min_lat) & (max_lat >= boxes[:, 2])
+    overlap_lon = np.zeros(len(boxes), dtype=bool)
+    for shift in (-360, 0, 360):
+        overlap_lon |= (boxes[:, 1] + shift >= min_lon) & (max_lon >= boxes[:, 0] + shift)
+    return overlap_lat & overlap_lon
+
+
+class TrackIndex:
+    """Uniform grid of along-track segment boxes for finding track-lines that come close to each other"""
+
+    def __init__(self, segments, cell_size=5.0):
+        self.cell_size = cell_size
+        self.columns = math.ceil(360 / cell_size)
+        self.sids = list(segments)
+        boxes = [np.asarray(segments[sid], dtype=np.float64).reshape(-1, 4) for sid in self.sids]
+        self.boxes = np.concatenate(boxes) if boxes else np.empty((0, 4))
+        # Track of every segment box
+        self.owner = np.repeat(np.arange(len(self.sids)), [len(b) for b in boxes])
+        self.cells = {}
+        for i, bbox in enumerate(self.boxes):
+            for cell in self._cells(bbox):
+                self.cells.setdefault(cell, []).append(i)
+
+    def _cells(self, bbox):
+        """Grid cells covered by a box, with longitude cells wrapping around at 360"""
+        min_lon, max_lon, min_lat, max_lat = bbox
+        first = math.floor(min_lon / self.cell_size)
+        last = min(math.floor(max_lon / self.cell_size), first + self.columns - 1)
+        lon_range = [i % self.columns for i in range(first, last + 1)]
+        lat_range = range(math.floor(min_lat / self.cell_size), math.floor(max_lat / self.cell_size) + 1)
+        return [(i, j) for i in lon_range for j in lat_range]
+
+    def query(self, boxes):
+        """Return the SIDs with a segment box overlapping any of the given boxes (one box or an array of them)"""
+        boxes = np.atleast_2d(np.asarray(boxes, dtype=np.float64))
+        found = np.zeros(len(self.sids), dtype=bool)
+        for bbox in boxes:
+            candidates = set()
+            for cell in self._cells(bbox):
+                candidates.update(self.cells.get(cell, ()))
+            if not candidates:
+                continue
+            candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            # Segments of tracks that already matched need no exact test
+            candidates = candidates[~found[self.owner[candidates]]]
+            overlap = boxes_overlap(self.boxes[candidates], bbox)
+            found[self.owner[candidates[overlap]]] = True
+        return [self.sids[i] for i in np.flatnonzero(found)]
+
+    def query_track(self, coordinates, segment_length=1.0):
+        """Return the SIDs with a segment coming close to a segment of the given track"""
+        return self.query(segment_boxes(coordinates, segment_length))
+
+    @classmethod
+    def build(cls, main_folder, sub_folders, cell_size=5.0, segment_length=1.0):
+        """
+        Build the index over all track-lines of a main folder.
+        The segment boxes of each track are stored in the folder's index file and reused while the track's
+        lon_lat.txt and the segment length are unchanged.
+        """
+        index_path = os.path.join(main_folder, INDEX_FILE_NAME)
+        stored = {}
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, 'r') as index_file:
+                    stored = json.load(index_file).get('tracks', {})
+            except (OSError, ValueError):
+                stored = {}
+
+        tracks = {}
+        for sub_folder in sub_folders:
+            coordinates_file = os.path.join(main_folder, sub_folder, 'lon_lat.txt')
+            if not os.path.exists(coordinates_file):
+                continue
+            signature = source_signature(coordinates_file)
+            entry = stored.get(sub_folder)
+            if entry and entry['size'] == signature['size'] and entry['mtime_ns'] == signature['mtime_ns'] \
+                    and entry.get('segment_length') == segment_length and 'segments' in entry:
+                tracks[sub_folder] = entry
+                continue
+            coordinates = read_coordinates(coordinates_file)
+            if len(coordinates) == 0:
+                continue
+            signature['segment_length'] = segment_length
+            signature['segments'] = segment_boxes(coordinates, segment_length).tolist()
+            tracks[sub_folder] = signature
+
+        try:
+            with open(index_path, 'w') as index_file:
+                json.dump({'tracks': tracks}, index_file)
+        except OSError:
+            pass
+
+        return cls({sid: entry['segments'] for sid, entry in tracks.items()}, cell_size)
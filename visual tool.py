@@ -1,131 +1,64 @@
 import os
 import sys
-import glob
 import numpy as np
 from PyQt5.QtWidgets import (
-    QApplication, QWidget, QVBoxLayout, QPushButton, QFileDialog, QLabel, QListWidget, QHBoxLayout, QGroupBox, QMessageBox, QSizePolicy
-
+    QApplication, QWidget, QVBoxLayout, QPushButton, QFileDialog, QLabel, QListWidget, QHBoxLayout, QGroupBox, QMessageBox, QSizePolicy,
+    QSpinBox, QComboBox, QCheckBox
 )
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from PyQt5.QtCore import pyqtSignal
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas, NavigationToolbar2QT
 from matplotlib.figure import Figure
+from matplotlib.colors import LogNorm
 import matplotlib.pyplot as plt
-import subprocess
-import shutil
-import concurrent.futures
-
-
-def read_coordinates(file_path):
-    coordinates = []
-    with open(file_path, 'r') as file:
-        for line in file:
-            lon, lat = map(float, line.strip().split())
-            if lon < 0:
-                lon += 360
-            coordinates.append((lon, lat))
-    return coordinates
-
-
-def get_bounding_box(coordinates):
-    min_lon = min(lon for lon, _ in coordinates)
-    max_lon = max(lon for lon, _ in coordinates)
-    min_lat = min(lat for _, lat in coordinates)
-    max_lat = max(lat for _, lat in coordinates)
-    return min_lon, max_lon, min_lat, max_lat
-
-
-def check_overlap(bbox1, bbox2):
-    min_lon1, max_lon1, min_lat1, max_lat1 = bbox1
-    min_lon2, max_lon2, min_lat2, max_lat2 = bbox2
-
-    overlap_lon = max_lon1 >= min_lon2 and max_lon2 >= min_lon1
-    overlap_lat = max_lat1 >= min_lat2 and max_lat2 >= min_lat1
-
-    return overlap_lon and overlap_lat
-
-
-def process_comparison(task):
-    coordinates_file1, coordinates_file2, output_subfolder1, output_subfolder2, SID = task
-    coordinates1 = read_coordinates(coordinates_file1)
-    coordinates2 = read_coordinates(coordinates_file2)
-
-    bbox1 = get_bounding_box(coordinates1)
-    bbox2 = get_bounding_box(coordinates2)
-
-    if check_overlap(bbox1, bbox2):
-        inputfile = os.path.join(output_subfolder2, 'bathy.xyz')
-        outputfile = os.path.join(output_subfolder1, f'bathy_{SID}.xyz')
-        shutil.copy2(inputfile, outputfile)
-
-
-def coe():
-    # Filter data in the bathy.xyz file based on specific conditions
-    with open("bathy.xyz", "r") as infile, open("filtered.xyz", "w") as outfile:
-        for line in infile:
-            parts = line.strip().split()
-            if len(parts) == 3 and parts[2].lower() not in ("0", "nan"):
-                outfile.write(line)
+from crossover import analyze_folders
+from folder_stats import FolderDataCache, list_statistics_folders
+from map_render import MapRenderer
+from plot_lod import minmax_decimate, density_grid
+from preprocess import preprocess_folder
+from instrumentation import run_report
 
-    # Find all files starting with bathy_ and ending with .xyz
-    bathy_files = glob.glob("bathy_*.xyz")
-
-    # Loop through each file and execute the x2sys_cross command
-    for filename in bathy_files:
-        output_file = f"{os.path.splitext(filename)[0]}_crossover.txt"
-
-        cross_command = f'gmt x2sys_cross filtered.xyz {filename} -Qe -W2 -TXYZ > {output_file}'
-        os.system(cross_command)
-
-    # Process all *_crossover.txt files
-    crossover_files = glob.glob("*_crossover.txt")
-    with open("crossover.txt", "w") as combined_file:
-        for file in crossover_files:
-            with open(file, "r") as infile:
-                for line_num, line in enumerate(infile, start=1):
-                    if line_num >= 5:
-                        parts = line.strip().split()
-                        # Extract required columns and write them to the output file
-                        combined_file.write(
-                            f"{float(parts[0]):.5f} {float(parts[1]):.5f} "
-                            f"{abs(float(parts[-2])):.1f}\n"
-                        )
-
-
-def process_folder(sub_folder1, main_folder1, main_folder2, sub_folders2):
-    output_subfolder1 = os.path.join(main_folder1, sub_folder1)
-    print(f'Currently processing folder: {output_subfolder1}')
-    coordinates_file1 = os.path.join(output_subfolder1, 'lon_lat.txt')
-
-    # Perform bounding box comparison
-    tasks = [
-        (coordinates_file1, os.path.join(main_folder2, sub_folder2, 'lon_lat.txt'), output_subfolder1,
-         os.path.join(main_folder2, sub_folder2), sub_folder2)
-        for sub_folder2 in sub_folders2 if sub_folder1 != sub_folder2
-    ]
-
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        executor.map(process_comparison, tasks)
-
-    # Run the `coe` function to complete `x2sys_cross` and subsequent processing
-    os.chdir(output_subfolder1)
-    coe()
-    os.chdir("..")
+# Scatter plots with more points than this are drawn as a density image
+SCATTER_POINT_LIMIT = 50000
+DENSITY_BINS = 300
+# Bins of the min/max decimation of the along-track depth plot
+LINE_BINS = 1000
 
 
 class ImageViewer(QWidget):
-    def __init__(self, folder_data, figsize=(8, 8), statistics_folder_path=None):
+    # Emitted from a loader thread when the data of a folder is available
+    data_loaded = pyqtSignal(str, object)
+    # Emitted from a render thread when the map of a folder is available
+    map_ready = pyqtSignal(str, object)
+
+    def __init__(self, folder_names, figsize=(8, 8), statistics_folder_path=None, cache_size=16, prefetch=2,
+                 prerender_maps=False):
         super().__init__()
-        self.folder_data = folder_data
         self.figsize = figsize
         self.statistics_folder_path = statistics_folder_path
+        self.prefetch = prefetch
+
+        # Folder data is loaded in the background and kept in a bounded LRU cache
+        self.folder_cache = FolderDataCache(statistics_folder_path, max_entries=cache_size)
+        self.data_loaded.connect(self.on_data_loaded)
+
+        # GMT maps are rendered off the UI thread and cached on disk, optionally for every folder up front
+        self.map_renderer = MapRenderer(os.path.join(os.getcwd(), 'crosspoint.cpt'))
+        self.map_ready.connect(self.on_map_ready)
+        if prerender_maps:
+            self.map_renderer.prerender(statistics_folder_path, folder_names)
 
         # Main layout
         layout = QHBoxLayout(self)
 
-        # Left side: List of subfolders
+        # Left side: List of subfolders and the loading status
+        left_layout = QVBoxLayout()
         self.folder_list = QListWidget()
-        self.folder_list.addItems(self.folder_data.keys())
+        self.folder_list.addItems(folder_names)
         self.folder_list.currentItemChanged.connect(self.update_plots)
-        layout.addWidget(self.folder_list, 1)  # Left side takes up 1 unit of width
+        left_layout.addWidget(self.folder_list)
+        self.status_label = QLabel("")
+        left_layout.addWidget(self.status_label)
+        layout.addLayout(left_layout, 1)  # Left side takes up 1 unit of width
 
         # Right side: Layout to display images
         self.right_layout = QVBoxLayout()
@@ -137,10 +70,19 @@ class ImageViewer(QWidget):
         self.canvas1 = self.create_square_canvas()
         self.canvas2 = self.create_square_canvas()
         self.canvas3 = self.create_square_canvas()  # New canvas for statistical plots
+        # Zooming or panning the first two plots re-bins them for the visible range
+        self.right_layout.addWidget(NavigationToolbar2QT(self.canvas1, self))
         self.right_layout.addWidget(self.canvas1)
+        self.right_layout.addWidget(NavigationToolbar2QT(self.canvas2, self))
         self.right_layout.addWidget(self.canvas2)
         self.right_layout.addWidget(self.canvas3)
 
+    def closeEvent(self, event):
+        """Stop the background loaders with the window"""
+        self.folder_cache.shutdown()
+        self.map_renderer.shutdown()
+        super().closeEvent(event)
+
     def create_square_canvas(self):
         """
         Create a square canvas
@@ -152,7 +94,7 @@ class ImageViewer(QWidget):
 
     def add_folder(self, folder_name, Topo, Ship, longitudes, latitudes, CrossoverFile):
         """Add subfolder data to the list"""
-        self.folder_data[folder_name] = (Topo, Ship, longitudes, latitudes, CrossoverFile)
+        self.folder_cache.put(folder_name, (Topo, Ship, longitudes, latitudes, CrossoverFile))
         self.folder_list.addItem(folder_name)
 
     def update_plots(self, current, previous):
@@ -161,24 +103,39 @@ class ImageViewer(QWidget):
             return  # Skip if no folder is selected
 
         folder_name = current.text()
-        Topo, Ship, longitudes, latitudes, CrossoverFile = self.folder_data.get(folder_name,
-                                                                                (None, None, None, None, None))
+        self.prefetch_neighbours(self.folder_list.row(current))
+        if not self.folder_cache.contains(folder_name):
+            self.status_label.setText(f"Loading {folder_name}...")
+        # Cached data comes back at once, anything else once a loader thread has read it
+        self.folder_cache.request(folder_name, self.data_loaded.emit)
+
+    def prefetch_neighbours(self, row):
+        """Load the folders next to the selected one in the background"""
+        rows = [row + offset for distance in range(1, self.prefetch + 1) for offset in (distance, -distance)]
+        self.folder_cache.prefetch([self.folder_list.item(r).text() for r in rows
+                                    if 0 <= r < self.folder_list.count()])
+
+    def on_data_loaded(self, folder_name, data):
+        """Draw a folder once its data is available, if it is still the selected one"""
+        current = self.folder_list.currentItem()
+        if current is None or current.text() != folder_name:
+            return
+        if data is None:
+            self.status_label.setText(f"No valid data in {folder_name}")
+            return
+        if isinstance(data, Exception):
+            self.status_label.setText(f"Failed to load {folder_name}: {data}")
+            return
+        self.status_label.setText("")
+
+        Topo, Ship, longitudes, latitudes, CrossoverFile = data
         if Topo is None or Ship is None or longitudes is None or latitudes is None or CrossoverFile is None:
             return  # Skip if data is missing
 
-        # Remove old FigureCanvas
-        for i in reversed(range(self.right_layout.count())):
-            widget = self.right_layout.itemAt(i).widget()
-            if widget:
-                widget.deleteLater()
-
-        # Create new FigureCanvas
-        self.canvas1 = FigureCanvas(Figure(figsize=self.figsize))
-        self.canvas2 = FigureCanvas(Figure(figsize=self.figsize))
-        self.canvas3 = FigureCanvas(Figure(figsize=self.figsize))  # New canvas for statistical plots
-        self.right_layout.addWidget(self.canvas1)
-        self.right_layout.addWidget(self.canvas2)
-        self.right_layout.addWidget(self.canvas3)
+        # Reuse the existing canvases; only their figures are redrawn
+        for canvas in (self.canvas1, self.canvas2, self.canvas3):
+            canvas.figure.clear()
+        self.canvas3.draw()
 
         # Draw new images
         self.plot_scatter(Topo, Ship, folder_name)
@@ -189,8 +146,29 @@ class ImageViewer(QWidget):
     def plot_scatter(self, Topo, Ship, folder_name):
         """Plot a scatter plot"""
         ax = self.canvas1.figure.subplots()
-        ax.scatter(Topo, Ship, s=0.5, label='Data Points')
+        if len(Topo) <= SCATTER_POINT_LIMIT:
+            ax.scatter(Topo, Ship, s=0.5, label='Data Points')
+        else:
+            # Large cruises are drawn as a point density image, re-binned for the visible area on zoom
+            counts, extent = density_grid(Topo, Ship, DENSITY_BINS)
+            density = ax.imshow(np.ma.masked_equal(counts, 0), origin='lower', extent=extent, aspect='auto',
+                                cmap='Blues', norm=LogNorm(), interpolation='nearest')
+
+            def refine_density(ax):
+                x_range, y_range = sorted(ax.get_xlim()), sorted(ax.get_ylim())
+                counts, extent = density_grid(Topo, Ship, DENSITY_BINS, x_range, y_range)
+                density.set_data(np.ma.masked_equal(counts, 0))
+                density.set_extent(extent)
+                self.canvas1.draw_idle()
+
         ax.plot([-10000, 100], [-10000, 100], label='Line of Unit Slope', color='#32CD32')
+        if len(Topo) > SCATTER_POINT_LIMIT:
+            # Fix the autoscaled view first so re-binning never moves the limits it reacts to
+            ax.autoscale_view()
+            ax.set_xlim(ax.get_xlim())
+            ax.set_ylim(ax.get_ylim())
+            ax.callbacks.connect('xlim_changed', refine_density)
+            ax.callbacks.connect('ylim_changed', refine_density)
         ax.set_xlabel('Topo', fontsize=8)
         ax.set_ylabel('Ship', fontsize=8)
         ax.legend(fontsize=6)
@@ -201,8 +179,18 @@ class ImageViewer(QWidget):
     def plot_line(self, Topo, Ship, folder_name):
         """Plot a line chart"""
         ax = self.canvas2.figure.subplots()
-        ax.plot(np.arange(len(Ship)), Ship, label='Ship Data', color='red')
-        ax.plot(np.arange(len(Topo)), Topo, label='Topo Data', color='#32CD32')
+        # Only the min/max envelope of each screen bin is drawn; zooming re-decimates the visible range
+        ship_line, = ax.plot(*minmax_decimate(Ship, bins=LINE_BINS), label='Ship Data', color='red')
+        topo_line, = ax.plot(*minmax_decimate(Topo, bins=LINE_BINS), label='Topo Data', color='#32CD32')
+
+        def refine_lines(ax):
+            start, stop = ax.get_xlim()
+            start, stop = int(np.floor(start)), int(np.ceil(stop)) + 1
+            ship_line.set_data(*minmax_decimate(Ship, start, stop, LINE_BINS))
+            topo_line.set_data(*minmax_decimate(Topo, start, stop, LINE_BINS))
+            self.canvas2.draw_idle()
+
+        ax.callbacks.connect('xlim_changed', refine_lines)
         ax.set_xlabel('X (Data Point)', fontsize=8)
         ax.set_ylabel('Z (Depth)', fontsize=8)
         ax.legend(fontsize=6)
@@ -212,42 +200,21 @@ class ImageViewer(QWidget):
 
     def plot_stat(self, longitudes, latitudes, sub_folder_path, crossover_file, folder_name):
         """Plot a statistical map"""
-        # Convert longitude and latitude to NumPy arrays
-        longitudes = np.array(longitudes)
-        latitudes = np.array(latitudes)
-
-        # Check if the longitudes cross the 180/-180 boundary
-        crosses_dateline = (longitudes.max() > 179) and (longitudes.min() < -179)
-
-        # Adjust longitudes crossing the boundary by adding 360 to negative values
-        if crosses_dateline:
-            longitudes[longitudes < 0] += 360
-
-        # Calculate min and max longitude and latitude
-        minlon, maxlon = longitudes.min(), longitudes.max()
-        minlat, maxlat = latitudes.min(), latitudes.max()
-
-        shutil.copy(os.path.join(os.getcwd(), 'crosspoint.cpt'), os.path.join(sub_folder_path, 'crosspoint.cpt'))
-        # Save the image to a temporary file
-        output_image = "map_plot.png"
-
-        # GMT command string
-        command = f"""
-        gmt begin map_plot png I+m0.2c
-        gmt set FONT_TITLE 10p,1,black
-        gmt set MAP_TITLE_OFFSET -5p
-        gmt coast -R{minlon - 5}/{maxlon + 5}/{minlat - 5}/{maxlat + 5} -JQ15c -Baf -Df -BWSen+t"{folder_name} ECOEs" -A5000 -Ggray
-        gmt plot bathy.xyz -R{minlon - 5}/{maxlon + 5}/{minlat - 5}/{maxlat + 5} -JQ15c -Sc0.01 -Gblue
-        gmt plot {os.path.join(sub_folder_path, crossover_file)} -R{minlon - 5}/{maxlon + 5}/{minlat - 5}/{maxlat + 5} -JQ15c -St0.1 -Ccrosspoint.cpt
-        gmt colorbar -DjBC+w5c/0.2c+o0c/-0.8c+m+h+e -S -Bxa1000f500 -G0/5000 -Ccrosspoint.cpt
-        gmt end
-        """
-
-        # Execute GMT command
-        os.chdir(sub_folder_path)  # Change to the subfolder path
-        os.system(command)
+        # GMT renders the map on a background thread; cached renderings come back without running GMT
+        self.map_renderer.request(sub_folder_path, folder_name, crossover_file, self.map_ready.emit,
+                                  longitudes, latitudes)
+
+    def on_map_ready(self, folder_name, output_image):
+        """Show a rendered map if its folder is still the selected one"""
+        current = self.folder_list.currentItem()
+        if current is None or current.text() != folder_name:
+            return
+        if output_image is None:
+            self.status_label.setText(f"Map of {folder_name} could not be rendered")
+            return
 
         # Load the image in PyQt
+        self.canvas3.figure.clear()
         ax = self.canvas3.figure.subplots()
         image = plt.imread(output_image)
         ax.imshow(image)
@@ -299,6 +266,18 @@ class App(QWidget):
         btn_select_grd.clicked.connect(self.select_grd_file)
         preprocess_layout.addWidget(btn_select_grd)
 
+        # Number of .m77t files processed in parallel
+        preprocess_workers_layout = QHBoxLayout()
+        preprocess_workers_layout.addWidget(QLabel("Workers:"))
+        self.spin_preprocess_workers = QSpinBox()
+        self.spin_preprocess_workers.setRange(1, os.cpu_count() or 1)
+        self.spin_preprocess_workers.setValue(os.cpu_count() or 1)
+        preprocess_workers_layout.addWidget(self.spin_preprocess_workers)
+        preprocess_layout.addLayout(preprocess_workers_layout)
+
+        self.label_preprocess_progress = QLabel("")
+        preprocess_layout.addWidget(self.label_preprocess_progress)
+
         btn_preprocess = QPushButton("Preprocess")
         btn_preprocess.clicked.connect(self.preprocess_folder)
         preprocess_layout.addWidget(btn_preprocess)
@@ -325,6 +304,22 @@ class App(QWidget):
         btn_select_input_folder_b.clicked.connect(self.select_intersection_input_folder_b)
         intersection_layout.addWidget(btn_select_input_folder_b)
 
+        # Number of A tracks analysed in parallel and the crossover engine
+        workers_layout = QHBoxLayout()
+        workers_layout.addWidget(QLabel("Workers:"))
+        self.spin_intersection_workers = QSpinBox()
+        self.spin_intersection_workers.setRange(1, os.cpu_count() or 1)
+        self.spin_intersection_workers.setValue(os.cpu_count() or 1)
+        workers_layout.addWidget(self.spin_intersection_workers)
+        workers_layout.addWidget(QLabel("Engine:"))
+        self.combo_intersection_engine = QComboBox()
+        self.combo_intersection_engine.addItems(["auto", "gmt", "native"])
+        workers_layout.addWidget(self.combo_intersection_engine)
+        intersection_layout.addLayout(workers_layout)
+
+        self.label_intersection_progress = QLabel("")
+        intersection_layout.addWidget(self.label_intersection_progress)
+
         btn_analyze = QPushButton("Crossover Analysis")
         btn_analyze.clicked.connect(self.analyze_intersection)
         intersection_layout.addWidget(btn_analyze)
@@ -344,6 +339,9 @@ class App(QWidget):
         btn_select_statistics_folder.clicked.connect(self.select_statistics_folder)
         statistics_layout.addWidget(btn_select_statistics_folder)
 
+        self.check_prerender_maps = QCheckBox("Pre-render maps for all folders")
+        statistics_layout.addWidget(self.check_prerender_maps)
+
         btn_generate_statistics = QPushButton("Generate Statistics")
         btn_generate_statistics.clicked.connect(self.generate_statistics)
         statistics_layout.addWidget(btn_generate_statistics)
@@ -416,8 +414,9 @@ class App(QWidget):
         if not hasattr(self, 'grd_file_path'):
             self.label_grd.setText("Please select a .grd model file first!")
             return
-        # Process each .m77t file
-        self.process_m77_files(self.folder_path, self.output_folder_path, self.grd_file_path)
+        # Process each .m77t file, with the stage timings written next to the outputs
+        with run_report('preprocess', os.path.join(self.output_folder_path, 'preprocess_report.json')):
+            self.process_m77_files(self.folder_path, self.output_folder_path, self.grd_file_path)
         self.label_folder.setText("Preprocessing Complete!")
 
     def analyze_intersection(self):
@@ -426,109 +425,48 @@ class App(QWidget):
             main_folder1 = self.intersection_input_folder_a
             main_folder2 = self.intersection_input_folder_b
 
-            sub_folders1 = [f for f in os.listdir(main_folder1) if os.path.isdir(os.path.join(main_folder1, f))]
-            sub_folders2 = [f for f in os.listdir(main_folder2) if os.path.isdir(os.path.join(main_folder2, f))]
-
-            # Process each folder sequentially
-            for sub_folder1 in sub_folders1:
-                process_folder(sub_folder1, main_folder1, main_folder2, sub_folders2)
+            # Process the folders of A across a pool of worker processes
+            with run_report('crossover', os.path.join(main_folder1, 'crossover_report.json')):
+                analyze_folders(main_folder1, main_folder2, workers=self.spin_intersection_workers.value(),
+                                progress=self.update_intersection_progress,
+                                engine=self.combo_intersection_engine.currentText())
 
             QMessageBox.information(self, "Completed", "Intersection analysis completed successfully!")
         except Exception as e:
             QMessageBox.critical(self, "Error", f"An error occurred: {str(e)}")
 
+    def update_intersection_progress(self, done, total, sub_folder):
+        """Show the progress of the crossover analysis"""
+        self.label_intersection_progress.setText(f"Completed {done}/{total}: {sub_folder}")
+        QApplication.processEvents()
+
     def generate_statistics(self):
         """Generate statistical results"""
         if not hasattr(self, 'statistics_folder_path'):
             self.label_statistics_folder.setText("Please select the main folder first!")
             return
 
-        folder_data = {}
-        sub_folders = [f for f in os.listdir(self.statistics_folder_path) if
-                       os.path.isdir(os.path.join(self.statistics_folder_path, f))]
-
-        for sub_folder in sub_folders:
-            sub_folder_path = os.path.join(self.statistics_folder_path, sub_folder)
-            ship_file_path = os.path.join(sub_folder_path, "bathy.xyz")
-            topo_file_path = os.path.join(sub_folder_path, "topo.xyz")
-            crossover_file_path = os.path.join(sub_folder_path, "crossover.txt")  # Assume crossover file path
-
-            if not os.path.exists(ship_file_path) or not os.path.exists(topo_file_path):
-                continue
+        # Only list the folders here; the viewer loads each one when it is selected
+        folder_names = list_statistics_folders(self.statistics_folder_path)
 
-            ship = np.loadtxt(ship_file_path, usecols=(0, 1, 2))
-            topo = np.loadtxt(topo_file_path, usecols=(0, 1, 2))
-
-            topo_dict = {(x, y): z for x, y, z in topo}
-            combined_data = [[topo_dict.get((x, y), None), z_ship] for x, y, z_ship in ship if (x, y) in topo_dict]
-            combined_data = [item for item in combined_data if None not in item]
-
-            if not combined_data:
-                continue
-
-            Topo, Ship = zip(*combined_data)
-            longitudes = [x for x, _, _ in ship]
-            latitudes = [y for _, y, _ in ship]
-            CrossoverFile = crossover_file_path if os.path.exists(crossover_file_path) else None
-            folder_data[sub_folder] = (
-                np.array(Topo), np.array(Ship), np.array(longitudes), np.array(latitudes), CrossoverFile)
-
-        if not folder_data:
+        if not folder_names:
             self.label_statistics_folder.setText("No valid data found!")
             return
 
-        self.viewer = ImageViewer(folder_data=folder_data, statistics_folder_path=self.statistics_folder_path)
+        self.viewer = ImageViewer(folder_names=folder_names, statistics_folder_path=self.statistics_folder_path,
+                                  prerender_maps=self.check_prerender_maps.isChecked())
         self.viewer.show()
 
     def process_m77_files(self, folder_path, output_folder_path, grd_file_path):
         """Process all .m77t files in the main folder"""
-        # Find all .m77t files that don't start with a dot
-        m77_files = [f for f in os.listdir(folder_path) if f.endswith(".m77t") and not f.startswith(".")]
-
-        for m77_file in m77_files:
-            # Build the full path for the .m77t file
-            m77_file_path = os.path.join(folder_path, m77_file)
-            sub_folder_name = os.path.splitext(m77_file)[0]
-            sub_folder_path = os.path.join(output_folder_path, sub_folder_name)
-            os.makedirs(sub_folder_path, exist_ok=True)  # Create the subfolder if it doesn't exist
-
-            # Copy the original .m77t file to the subfolder
-            shutil.copy(m77_file_path, os.path.join(sub_folder_path, m77_file))
-
-            # Generate the bathy.xyz file
-            bathy_file_path = os.path.join(sub_folder_path, "bathy.xyz")
-            with open(bathy_file_path, "w") as bathy_file:
-                # Run the GMT command to extract data from the .m77t file
-                mgd77_command = [
-                    "gmt", "mgd77list", m77_file_path, "-Flon,lat,depth"
-                ]
-                process = subprocess.Popen(mgd77_command, stdout=subprocess.PIPE, text=True)
-                for line in process.stdout:
-                    parts = line.strip().split()
-                    if len(parts) == 3:  # Check if the line has the expected number of columns
-                        lon, lat, depth = map(float, parts)
-                        bathy_file.write(f"{lon} {lat} {-depth}\n")  # Write data with depth as a negative value
-
-            # Generate the lon_lat.txt file
-            lon_lat_file_path = os.path.join(sub_folder_path, "lon_lat.txt")
-            with open(bathy_file_path, "r") as bathy_file, open(lon_lat_file_path, "w") as lon_lat_file:
-                for line in bathy_file:
-                    parts = line.strip().split()
-                    if len(parts) == 3:  # Check if the line has the expected number of columns
-                        lon, lat, depth = map(float, parts)
-                        if depth != 0 and not (depth != depth):  # Ensure depth is not zero or NaN
-                            lon_lat_file.write(f"{lon} {lat}\n")  # Write longitude and latitude
-
-            # Run the grdtrack command to create topo.xyz
-            topo_file_path = os.path.join(sub_folder_path, "topo.xyz")
-            grdtrack_command = [
-                "gmt", "grdtrack", lon_lat_file_path, f"-G{grd_file_path}"
-            ]
-            with open(topo_file_path, "w") as topo_file:
-                subprocess.run(grdtrack_command, stdout=topo_file, text=True)  # Run the command and write the output
-
-
-
+        preprocess_folder(folder_path, output_folder_path, grd_file_path,
+                          workers=self.spin_preprocess_workers.value(), progress=self.update_preprocess_progress)
+
+    def update_preprocess_progress(self, done, total, sub_folder, processed):
+        """Show the progress of the preprocessing"""
+        status = "processed" if processed else "up to date"
+        self.label_preprocess_progress.setText(f"Completed {done}/{total}: {sub_folder} ({status})")
+        QApplication.processEvents()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+import os
+import json
+import shutil
+import tempfile
+import subprocess
+import numpy as np
+from xyz_cache import source_signature
+from xyz_io import x2sys_segments
+
+# Persistent x2sys home of a folder B, holding the TAG database and one link per registered track
+X2SYS_HOME_DIR = '.x2sys'
+TAG_NAME = 'BATHY'
+TRACKS_DIR = 'tracks'
+REGISTRY_FILE_NAME = 'registered.json'
+
+# Candidate tracks crossed against one folder A track per x2sys_cross invocation
+BATCH_SIZE = 64
+
+
+class TagDatabase:
+    """
+    x2sys TAG database of every bathy.xyz of a folder B.
+    Tracks are linked as tracks/<SID>.xyz so x2sys finds them by SID, and their bins are registered with
+    x2sys_binlist/x2sys_put once; later runs only re-register tracks whose bathy.xyz changed.
+    """
+
+    def __init__(self, main_folder):
+        self.main_folder = main_folder
+        self.home = os.path.abspath(os.path.join(main_folder, X2SYS_HOME_DIR))
+        self.tracks_dir = os.path.join(self.home, TRACKS_DIR)
+        self.registry_path = os.path.join(self.home, REGISTRY_FILE_NAME)
+        self.environment = dict(os.environ, X2SYS_HOME=self.home)
+        # SIDs registered in the database
+        self.registered = set()
+
+    def gmt(self, arguments, **kwargs):
+        return subprocess.run(['gmt'] + arguments, env=self.environment, check=True, **kwargs)
+
+    def load_registry(self):
+        try:
+            with open(self.registry_path, 'r') as registry_file:
+                return json.load(registry_file)
+        except (OSError, ValueError):
+            return None
+
+    def save_registry(self, registry):
+        temporary_path = f'{self.registry_path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w') as registry_file:
+            json.dump(registry, registry_file)
+        os.replace(temporary_path, self.registry_path)
+
+    def initialize(self):
+        """Create an empty TAG whose only track path is the tracks folder"""
+        if os.path.exists(self.home):
+            shutil.rmtree(self.home)
+        os.makedirs(self.tracks_dir)
+        # geoz: lon, lat, z columns; -Gd: discontinuity at the dateline, i.e. -180/180 longitudes as in the
+        # .m77t files, over the matching global region; 1 degree bins
+        self.gmt(['x2sys_init', TAG_NAME, '-Dgeoz', '-Exyz', '-Gd', '-R-180/180/-90/90', '-I1', '-F'],
+                 cwd=self.home)
+        with open(os.path.join(self.home, TAG_NAME, f'{TAG_NAME}_paths.txt'), 'w') as paths_file:
+            paths_file.write(self.tracks_dir + '\n')
+        return {}
+
+    def link_track(self, SID):
+        source = os.path.abspath(os.path.join(self.main_folder, SID, 'bathy.xyz'))
+        link = os.path.join(self.tracks_dir, f'{SID}.xyz')
+        if os.path.lexists(link):
+            os.remove(link)
+        try:
+            os.symlink(source, link)
+        except OSError:
+            shutil.copy2(source, link)
+
+    def update(self, sub_folders):
+        """
+        Register the tracks of the given SID folders that are new or whose bathy.xyz changed.
+        A track that disappeared from the folder cannot be binned any more, so the TAG is then rebuilt.
+        Returns the number of tracks (re)registered.
+        """
+        signatures = {SID: source_signature(os.path.join(self.main_folder, SID, 'bathy.xyz'))
+                      for SID in sub_folders if os.path.exists(os.path.join(self.main_folder, SID, 'bathy.xyz'))}
+        registry = self.load_registry()
+        if registry is None or not os.path.isdir(os.path.join(self.home, TAG_NAME)) or \
+                any(SID not in signatures for SID in registry):
+            registry = self.initialize()
+
+        changed = sorted(SID for SID, signature in signatures.items() if registry.get(SID) != signature)
+        for start in range(0, len(changed), BATCH_SIZE):
+            batch = changed[start:start + BATCH_SIZE]
+            for SID in batch:
+                self.link_track(SID)
+            binlist = self.gmt(['x2sys_binlist'] + [f'{SID}.xyz' for SID in batch] + [f'-T{TAG_NAME}'],
+                               cwd=self.tracks_dir, capture_output=True, text=True)
+            # -F replaces the bins of tracks registered before
+            self.gmt(['x2sys_put', f'-T{TAG_NAME}', '-F'], cwd=self.tracks_dir, input=binlist.stdout, text=True)
+            registry.update((SID, signatures[SID]) for SID in batch)
+            self.save_registry(registry)
+        self.registered = set(registry)
+        return len(changed)
+
+    def cross(self, track_file, SIDs):
+        """
+        Crossovers of one track file against registered tracks in a single x2sys_cross invocation.
+        Only the (track, SID) combinations are computed, not the SIDs against each other.
+        Returns {SID: rows of (lon, lat, z_X, z_M)}.
+        """
+        # x2sys names a track by its path without the suffix; the combination file uses the same names
+        track_name = os.path.splitext(os.path.abspath(track_file))[0]
+        descriptor, combinations = tempfile.mkstemp(prefix='.x2sys_pairs.', suffix='.txt',
+                                                    dir=os.path.dirname(track_name))
+        with os.fdopen(descriptor, 'w') as combinations_file:
+            combinations_file.write(''.join(f'{track_name}\t{SID}\n' for SID in SIDs))
+        try:
+            result = self.gmt(['x2sys_cross', track_name] + list(SIDs) +
+                              [f'-T{TAG_NAME}', f'-A{combinations}', '-Qe', '-W2'],
+                              cwd=self.tracks_dir, capture_output=True, text=True)
+        finally:
+            os.remove(combinations)
+        return split_x2sys_output(result.stdout, SIDs)
+
+
+def split_x2sys_output(text, SIDs):
+    """Split the output of one x2sys_cross invocation into rows of (lon, lat, z_X, z_M) per SID"""
+    wanted = set(SIDs)
+    pairs = {SID: [] for SID in SIDs}
+    for header, rows in x2sys_segments(text):
+        # Segment header of a track pair: "> track1 ... track2 ..."
+        match = {os.path.splitext(os.path.basename(name))[0] for name in header} & wanted
+        if match:
+            pairs[match.pop()].append(rows)
+    return {SID: np.concatenate(rows) if rows else np.empty((0, 4)) for SID, rows in pairs.items()}
@@ -0,0 +1,84 @@
+import os
+import json
+import threading
+import numpy as np
+from xyz_io import read_columns
+
+# Sidecar files are written next to the text file: bathy.xyz -> bathy.xyz.npy + bathy.xyz.npy.json
+CACHE_SUFFIX = '.npy'
+META_SUFFIX = '.npy.json'
+
+
+def cache_paths(file_path):
+    """Return the binary array path and the metadata path of a text file's cache"""
+    return file_path + CACHE_SUFFIX, file_path + META_SUFFIX
+
+
+def source_signature(file_path):
+    """Size and modification time used to decide whether a cache is still valid"""
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def parse_columns(file_path, ncols):
+    """Parse the first ncols whitespace-delimited columns of a text file into a 2-D float array"""
+    return read_columns(file_path, ncols)
+
+
+def cache_is_valid(file_path, ncols):
+    """Check that the cache exists and was built from the current version of the text file"""
+    array_path, meta_path = cache_paths(file_path)
+    if not os.path.exists(array_path) or not os.path.exists(meta_path):
+        return False
+    try:
+        with open(meta_path, 'r') as meta_file:
+            meta = json.load(meta_file)
+    except (OSError, ValueError):
+        return False
+    signature = source_signature(file_path)
+    return (meta.get('size') == signature['size'] and meta.get('mtime_ns') == signature['mtime_ns']
+            and meta.get('ncols') == ncols)
+
+
+def write_cache(file_path, data):
+    """Write the binary sidecar cache of a text file; an unwritable folder simply leaves it uncached"""
+    array_path, meta_path = cache_paths(file_path)
+    meta = source_signature(file_path)
+    meta['ncols'] = int(data.shape[1])
+    # Temporary names unique to the process and thread, so concurrent writers of the same cache (e.g. the
+    # viewer's loader and render threads) never share a file; a reader never sees a half-written cache
+    suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(array_path + suffix, 'wb') as array_file:
+            np.save(array_file, np.ascontiguousarray(data, dtype=np.float64))
+        with open(meta_path + suffix, 'w') as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(array_path + suffix, array_path)
+        os.replace(meta_path + suffix, meta_path)
+    except OSError:
+        for path in (array_path + suffix, meta_path + suffix):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def update_cache(file_path, ncols):
+    """Parse a text file and (re)write its cache unless the existing cache is still valid"""
+    if cache_is_valid(file_path, ncols):
+        return
+    write_cache(file_path, parse_columns(file_path, ncols))
+
+
+def load_columns(file_path, ncols, mmap=True):
+    """
+    Load a numeric text file as a 2-D float array with ncols columns.
+    An up-to-date binary cache is memory-mapped; otherwise the text is parsed and the cache refreshed.
+    """
+    if cache_is_valid(file_path, ncols):
+        array_path, _ = cache_paths(file_path)
+        try:
+            return np.load(array_path, mmap_mode='r' if mmap else None)
+        except (OSError, ValueError):
+            pass
+    data = parse_columns(file_path, ncols)
+    write_cache(file_path, data)
+    return data
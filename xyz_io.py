@@ -0,0 +1,161 @@
+"""
+Bulk reading and writing of the whitespace-delimited text files of the pipeline: xyz files
+(bathy.xyz, topo.xyz, lon_lat.txt, crossover.txt and the correction outputs) and `x2sys_cross` output.
+
+Text is parsed a chunk at a time with a single NumPy conversion per chunk, and written by formatting
+a whole chunk of rows with a single str.format call. Rows are formatted from Python floats, so '{}'
+gives the same repr text as f'{x}' and np.savetxt(fmt='%s').
+"""
+import io
+import warnings
+import numpy as np
+
+# Text read per chunk, in bytes, and rows formatted per write
+CHUNK_BYTES = 1 << 24
+CHUNK_ROWS = 200000
+
+# Layout of crossover.txt: lon, lat, |COE|
+CROSSOVER_FORMAT = '{:.5f} {:.5f} {:.1f}\n'
+
+# Number of header lines written by `gmt x2sys_cross` before the crossover rows
+X2SYS_HEADER_LINES = 4
+
+
+def row_format(ncols, field='{}'):
+    """Line format of ncols space-separated fields, repr floats by default"""
+    return ' '.join([field] * ncols) + '\n'
+
+
+def format_rows(rows, line_format=None):
+    """Format the rows of a 2-D array (of numbers or string tokens) as text, one line per row"""
+    rows = np.asarray(rows)
+    if len(rows) == 0:
+        return ''
+    line_format = line_format or row_format(rows.shape[1])
+    return (line_format * len(rows)).format(*rows.ravel().tolist())
+
+
+def write_rows(text_file, rows, line_format=None, chunk_rows=CHUNK_ROWS):
+    """Write the rows of a 2-D array to an open text file, a chunk of rows at a time"""
+    for start in range(0, len(rows), chunk_rows):
+        text_file.write(format_rows(rows[start:start + chunk_rows], line_format))
+
+
+def write_xyz(file_path, rows, line_format=None):
+    """Write a 2-D array as a whitespace-delimited text file (repr floats unless a line format is given)"""
+    with open(file_path, 'w') as text_file:
+        write_rows(text_file, rows, line_format)
+
+
+def iter_text_chunks(text_file, chunk_bytes=CHUNK_BYTES):
+    """Yield the text of an open file in chunks of about chunk_bytes that end at a line break"""
+    while True:
+        text = text_file.read(chunk_bytes)
+        if not text:
+            return
+        yield text + text_file.readline()
+
+
+def iter_line_chunks(text_file, chunk_bytes=CHUNK_BYTES):
+    """Yield lists of whole lines of an open text file or stream, about chunk_bytes of text each"""
+    while True:
+        lines = text_file.readlines(chunk_bytes)
+        if not lines:
+            return
+        yield lines
+
+
+def parse_uniform(text):
+    """
+    Parse whitespace-delimited text whose lines all have the same number of columns with one
+    np.fromstring call. Returns a 2-D float array, or None for anything else (comments, blank lines,
+    ragged rows or unparsable tokens).
+    """
+    first_line = text[:text.find('\n')] if '\n' in text else text
+    ncols = len(first_line.split())
+    if ncols == 0 or '#' in text:
+        return None
+    nrows = text.count('\n') + (not text.endswith('\n'))
+
+    # Tokens per line, counted on the bytes: a token starts at a non-blank byte after a blank one
+    data = np.frombuffer(text.encode(), dtype=np.uint8)
+    blank = (data == ord(' ')) | (data == ord('\t')) | (data == ord('\n')) | (data == ord('\r'))
+    token_start = ~blank
+    token_start[1:] &= blank[:-1]
+    line_ends = np.searchsorted(np.flatnonzero(token_start), np.flatnonzero(data == ord('\n')))
+    tokens = np.diff(line_ends, prepend=0, append=np.count_nonzero(token_start))[:nrows]
+    if np.any(tokens != ncols):
+        return None
+
+    try:
+        values = np.fromstring(text, sep=' ')
+    except ValueError:
+        return None
+    if values.size != nrows * ncols:
+        return None
+    return values.reshape(nrows, ncols)
+
+
+def parse_text(text, ncols):
+    """
+    Parse the first ncols columns of whitespace-delimited text into a 2-D float array.
+    Text that parse_uniform cannot convert goes through np.loadtxt, with its usual errors.
+    """
+    values = parse_uniform(text)
+    if values is not None and values.shape[1] >= ncols:
+        return values[:, :ncols]
+    with warnings.catch_warnings():
+        # Empty files (e.g. a crossover.txt without crossovers) are valid and give an empty array
+        warnings.simplefilter('ignore', UserWarning)
+        return np.loadtxt(io.StringIO(text), usecols=range(ncols), ndmin=2)
+
+
+def read_columns(file_path, ncols, chunk_bytes=CHUNK_BYTES):
+    """Read the first ncols whitespace-delimited columns of a text file into a 2-D float array"""
+    with open(file_path, 'r') as text_file:
+        chunks = [parse_text(text, ncols) for text in iter_text_chunks(text_file, chunk_bytes)]
+    chunks = [chunk for chunk in chunks if len(chunk)]
+    if not chunks:
+        return np.empty((0, ncols))
+    return np.ascontiguousarray(np.concatenate(chunks)) if len(chunks) > 1 else np.ascontiguousarray(chunks[0])
+
+
+def select_rows(lines, ncols):
+    """Parse the text lines that have exactly ncols columns into a 2-D float array; other lines are skipped"""
+    return parse_text(''.join(line for line in lines if len(line.split()) == ncols), ncols)
+
+
+def x2sys_rows(lines):
+    """lon, lat, z_X and z_M of x2sys_cross data lines; comment and segment header lines are skipped"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        return np.loadtxt(lines, usecols=(0, 1, -2, -1), comments=('#', '>'), ndmin=2).reshape(-1, 4)
+
+
+def read_x2sys(file_path):
+    """Read the lon, lat, z_X and z_M columns of a `x2sys_cross` output file of one track pair"""
+    with open(file_path, 'r') as cross_file:
+        lines = cross_file.readlines()
+    return x2sys_rows(lines[X2SYS_HEADER_LINES:])
+
+
+def x2sys_segments(text):
+    """Yield (header tokens, rows of lon, lat, z_X, z_M) for each track pair segment of x2sys_cross output"""
+    header = None
+    lines = []
+    for line in text.splitlines(keepends=True):
+        if line.startswith('>'):
+            if header is not None:
+                yield header, x2sys_rows(lines)
+            header, lines = line[1:].split(), []
+        elif header is not None:
+            lines.append(line)
+    if header is not None:
+        yield header, x2sys_rows(lines)
+
+
+def write_x2sys(file_path, rows, header):
+    """Write crossover rows of (lon, lat, z_X, z_M) after the given X2SYS_HEADER_LINES header lines"""
+    with open(file_path, 'w') as cross_file:
+        cross_file.write(''.join(f'{line}\n' for line in header))
+        write_rows(cross_file, np.asarray(rows).reshape(-1, 4))